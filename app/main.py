@@ -1,10 +1,39 @@
+import asyncio
+import os
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
+from fastapi.responses import JSONResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from app.routers import auth, session, chat
 from app.models.database import User, engine
+from app.models.migrations import run_migrations
+from app.services import llm
+from app.services.memory_worker import memory_worker
+from app.services.startup import readiness, warm_up
+from app.utils import metrics
+from app.utils.embeddings import embedding_stats
 from sqlmodel import Session as DBSession, select
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await asyncio.to_thread(run_migrations)
+    memory_worker.start()
+    # Warm up in the background: /healthz answers right away, /readyz once warm
+    warmup = asyncio.create_task(warm_up())
+    yield
+    readiness.draining = True
+    warmup.cancel()
+    # Finish ingesting queued turns before the worker exits
+    await memory_worker.stop()
+    await llm.client.aclose()
+
+
+app = FastAPI(lifespan=lifespan)
+
+# Server-Timing header with per-stage durations on every response
+METRICS_TIMING_HEADER = os.getenv("METRICS_TIMING_HEADER", "false").lower() in ("1", "true", "yes")
+app.add_middleware(metrics.MetricsMiddleware, timing_header=METRICS_TIMING_HEADER)
 
 # Configure CORS
 app.add_middleware(
@@ -24,6 +53,19 @@ app.include_router(auth.router, prefix="/auth", tags=["auth"])
 app.include_router(session.router, prefix="/session", tags=["session"])
 app.include_router(chat.router, prefix="/chat", tags=["chat"])
 
+@app.get("/healthz", include_in_schema=False)
+def healthz():
+    """Liveness: the process is up and serving requests, and warmup hasn't given up"""
+    if readiness.error:
+        return JSONResponse({"status": "failed", "error": readiness.error}, status_code=503)
+    return {"status": "ok"}
+
+@app.get("/readyz", include_in_schema=False)
+def readyz():
+    """Readiness: warmup finished and the worker isn't shutting down"""
+    status = readiness.status()
+    return JSONResponse(status, status_code=200 if status["status"] == "ready" else 503)
+
 # Debug endpoint to list all users (remove in production!)
 @app.get("/debug/users")
 def list_users():
@@ -31,5 +73,20 @@ def list_users():
         users = db.exec(select(User)).all()
         return {"users": [{"id": u.id, "username": u.username} for u in users]}
 
+@app.get("/debug/embeddings")
+def embedding_cache_stats():
+    return embedding_stats()
+
+@app.get("/debug/llm")
+def llm_stats():
+    return {"usage": llm.client.usage, "cache": llm.client.cache.stats(), "admission": llm.client.admission.stats()}
+
+@app.get("/metrics", include_in_schema=False)
+def prometheus_metrics():
+    stats = memory_worker.stats()
+    metrics.memory_queue_depth.set(stats["queue_depth"])
+    metrics.memory_lag_seconds.set(stats["last_lag_seconds"])
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
 #uvicorn app.main:app --reload
 
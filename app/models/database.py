@@ -1,28 +1,77 @@
-from sqlmodel import SQLModel,Field, create_engine,Session
+from sqlmodel import SQLModel,Field,Session
+from sqlalchemy import Index, func
 from typing import Optional,Dict,Any
 import json
 from datetime import datetime
 
 class User(SQLModel,table=True):
     id:Optional[int]=Field(default=None, primary_key=True)
-    username:str
+    username:str = Field(index=True, unique=True)
     password_hash:str
 
 class SessionData(SQLModel,table=True):
     id:Optional[int]=Field(default=None, primary_key=True)
-    session_id: str
-    user_id:int
+    session_id: str = Field(index=True, unique=True)
+    user_id:int = Field(index=True)
     data:Optional[str] = Field(default="{}")
     session_name:Optional[str] = Field(default="New Chat")
+    # Running summary of the turns older than the prompt's history window,
+    # covering messages up to and including seq summary_seq
+    summary:Optional[str] = Field(default=None)
+    summary_seq:int = Field(default=-1, sa_column_kwargs={"server_default": "-1"})
+    # Bumped by every new message and rename; drives the session list's ETag
+    updated_at:datetime = Field(default_factory=datetime.now, sa_column_kwargs={"server_default": func.now()})
+
+
+class ChatMessage(SQLModel, table=True):
+    """One chat turn; append-only, ordered by seq within a session"""
+    __table_args__ = (
+        Index("ix_chatmessage_session_seq", "session_id", "seq", unique=True),
+    )
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    session_id: str
+    seq: int
+    role: str
+    content: str
+    created_at: datetime = Field(default_factory=datetime.now)
+
+
+class Interaction(SQLModel, table=True):
+    """One indexed user/assistant exchange, the text behind the lexical index.
+
+    Rows mirror the interaction embeddings in the vector store (same doc_id);
+    the interaction_fts full-text index over them is kept in sync by triggers
+    created in migration 0006.
+    """
+    id: Optional[int] = Field(default=None, primary_key=True)
+    doc_id: str = Field(index=True, unique=True)
+    user_id: int = Field(index=True)
+    session_id: str
+    content: str
+    created_at: datetime = Field(default_factory=datetime.now)
 
 
 class UserFact(SQLModel, table=True):
+    """A fact about a user. Facts are never deleted: a contradicted fact is
+    kept for auditing and points at the fact that replaced it."""
+    __table_args__ = (
+        Index("ix_userfact_user_active", "user_name", "superseded_by"),
+        Index("ix_userfact_user_updated", "user_name", "updated_at"),
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
-    user_name: str
+    user_name: str = Field(index=True)
     fact_type: str  # "preference", "habit", "demographic", etc.
     fact_content: str
     source_message: str     # e.g., chat/interaction
     created_at: datetime = Field(default_factory=datetime.now)
+    # server_default keeps raw INSERTs (benchmarks, manual fixes) valid against the NOT NULL column
+    valid_from: datetime = Field(default_factory=datetime.now, sa_column_kwargs={"server_default": func.now()})
+    superseded_by: Optional[int] = Field(default=None)  # id of the fact that replaced this one
+    superseded_at: Optional[datetime] = Field(default=None)
+    # Set on insert and again when superseded; the cursor for incremental reads
+    updated_at: datetime = Field(default_factory=datetime.now, sa_column_kwargs={"server_default": func.now()})
 
     def to_dict(self):
         """Convert UserFact instance to dictionary"""
@@ -32,14 +81,19 @@ class UserFact(SQLModel, table=True):
             'fact_type': self.fact_type,
             'fact_content': self.fact_content,
             'source_message': self.source_message,
-            'created_at': self.created_at
+            'created_at': self.created_at,
+            'valid_from': self.valid_from,
+            'superseded_by': self.superseded_by,
+            'superseded_at': self.superseded_at,
+            'updated_at': self.updated_at,
         }
 
 
 
 import os
+from app.models.storage import create_storage_engine
 
 # Use /app/data for persistence in Docker
 db_path = os.getenv("DATABASE_PATH", "/app/data/mydb.sqlite")
-engine = create_engine(f"sqlite:///{db_path}", echo=True)
-SQLModel.metadata.create_all(engine)
+# Connections are opened on first use; tables are created by run_migrations() at startup
+engine = create_storage_engine(db_path)
@@ -0,0 +1,194 @@
+import json
+from datetime import datetime
+
+from sqlalchemy import text
+from sqlmodel import SQLModel
+
+from app.models.database import engine
+
+# Ordered (name, function) pairs; each runs once, in its own transaction
+MIGRATIONS = []
+
+
+def migration(name: str):
+    def register(func):
+        MIGRATIONS.append((name, func))
+        return func
+    return register
+
+
+@migration("0001_chat_messages_from_session_data")
+def chat_messages_from_session_data(conn):
+    """Copy the JSON chat history blobs into the append-only chatmessage table.
+
+    The old data column is left untouched so the previous release can still
+    read it, but nothing writes to it any more.
+    """
+    rows = conn.execute(text(
+        "SELECT session_id, data FROM sessiondata WHERE data IS NOT NULL AND data NOT IN ('', '{}', '[]')"
+    )).all()
+    now = datetime.now()
+    for session_id, data in rows:
+        try:
+            chat_history = json.loads(data)
+        except json.JSONDecodeError:
+            continue
+        if not isinstance(chat_history, list):
+            continue
+        already_migrated = conn.execute(
+            text("SELECT 1 FROM chatmessage WHERE session_id = :session_id LIMIT 1"),
+            {"session_id": session_id},
+        ).first()
+        if already_migrated:
+            continue
+        messages = [
+            {"session_id": session_id, "seq": seq, "role": msg.get("role"), "content": msg.get("content") or "", "created_at": now}
+            for seq, msg in enumerate(m for m in chat_history if isinstance(m, dict) and m.get("role"))
+        ]
+        if messages:
+            conn.execute(
+                text(
+                    "INSERT INTO chatmessage (session_id, seq, role, content, created_at) "
+                    "VALUES (:session_id, :seq, :role, :content, :created_at)"
+                ),
+                messages,
+            )
+
+
+@migration("0002_lookup_indexes")
+def lookup_indexes(conn):
+    """Index the columns every service filters on.
+
+    New databases get these from the model definitions; this adds them to
+    tables created before they existed. Unique indexes fall back to plain ones
+    when old data already holds duplicates, so startup never fails on them.
+    """
+    indexes = [
+        ("ix_user_username", "user", "username", True),
+        ("ix_sessiondata_session_id", "sessiondata", "session_id", True),
+        ("ix_sessiondata_user_id", "sessiondata", "user_id", False),
+        ("ix_userfact_user_name", "userfact", "user_name", False),
+    ]
+    for name, table, column, unique in indexes:
+        if unique:
+            duplicates = conn.execute(text(
+                f'SELECT {column} FROM "{table}" GROUP BY {column} HAVING COUNT(*) > 1 LIMIT 1'
+            )).first()
+            if duplicates:
+                print(f"Duplicate {table}.{column} values found; creating {name} as a non-unique index")
+                unique = False
+        conn.execute(text(
+            f'CREATE {"UNIQUE " if unique else ""}INDEX IF NOT EXISTS {name} ON "{table}" ({column})'
+        ))
+    conn.execute(text("ANALYZE"))
+
+
+def _columns(conn, table: str) -> set:
+    return {row[1] for row in conn.execute(text(f'PRAGMA table_info("{table}")'))}
+
+
+def _add_column(conn, table: str, column: str, ddl: str):
+    # Tables created from the current models already have the column
+    if column not in _columns(conn, table):
+        conn.execute(text(f'ALTER TABLE "{table}" ADD COLUMN {column} {ddl}'))
+
+
+@migration("0003_userfact_versioning")
+def userfact_versioning(conn):
+    """Soft-versioned facts: valid_from, superseded_by and superseded_at"""
+    _add_column(conn, "userfact", "valid_from", "TIMESTAMP")
+    _add_column(conn, "userfact", "superseded_by", "INTEGER")
+    _add_column(conn, "userfact", "superseded_at", "TIMESTAMP")
+    conn.execute(text("UPDATE userfact SET valid_from = created_at WHERE valid_from IS NULL"))
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_userfact_user_active ON userfact (user_name, superseded_by)"
+    ))
+
+
+@migration("0004_session_summaries")
+def session_summaries(conn):
+    """Rolling per-session summary of turns older than the history window"""
+    _add_column(conn, "sessiondata", "summary", "TEXT")
+    _add_column(conn, "sessiondata", "summary_seq", "INTEGER NOT NULL DEFAULT -1")
+
+
+@migration("0005_change_stamps")
+def change_stamps(conn):
+    """updated_at on sessions and facts, for ETags and incremental reads"""
+    _add_column(conn, "sessiondata", "updated_at", "TIMESTAMP")
+    _add_column(conn, "userfact", "updated_at", "TIMESTAMP")
+    conn.execute(text(
+        "UPDATE sessiondata SET updated_at = COALESCE("
+        "(SELECT MAX(created_at) FROM chatmessage WHERE chatmessage.session_id = sessiondata.session_id), :now"
+        ") WHERE updated_at IS NULL"
+    ), {"now": datetime.now()})
+    conn.execute(text(
+        "UPDATE userfact SET updated_at = COALESCE(superseded_at, valid_from, created_at) WHERE updated_at IS NULL"
+    ))
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_userfact_user_updated ON userfact (user_name, updated_at)"
+    ))
+
+
+@migration("0006_interaction_fts")
+def interaction_fts(conn):
+    """BM25 full-text index over indexed interactions.
+
+    Contentless FTS5: the text lives in the interaction table and triggers
+    keep the index in step with it. Each row also indexes a u<user_id>
+    token, so a search restricted to one user is answered from the inverted
+    index instead of filtering every user's matches. Older history is added
+    by `python -m app.services.reindex --lexical-only`.
+    """
+    try:
+        conn.execute(text(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS interaction_fts USING fts5("
+            "content, user_key, content='', tokenize='unicode61 remove_diacritics 2')"
+        ))
+    except Exception as e:
+        # Without FTS5 in the SQLite build, retrieval falls back to vector search alone
+        print(f"SQLite FTS5 unavailable, lexical retrieval disabled: {e}")
+        return
+    conn.execute(text(
+        "CREATE TRIGGER IF NOT EXISTS interaction_fts_insert AFTER INSERT ON interaction BEGIN "
+        "INSERT INTO interaction_fts (rowid, content, user_key) VALUES (new.id, new.content, 'u' || new.user_id); "
+        "END"
+    ))
+    conn.execute(text(
+        "CREATE TRIGGER IF NOT EXISTS interaction_fts_delete AFTER DELETE ON interaction BEGIN "
+        "INSERT INTO interaction_fts (interaction_fts, rowid, content, user_key) "
+        "VALUES ('delete', old.id, old.content, 'u' || old.user_id); "
+        "END"
+    ))
+    conn.execute(text(
+        "CREATE TRIGGER IF NOT EXISTS interaction_fts_update AFTER UPDATE ON interaction BEGIN "
+        "INSERT INTO interaction_fts (interaction_fts, rowid, content, user_key) "
+        "VALUES ('delete', old.id, old.content, 'u' || old.user_id); "
+        "INSERT INTO interaction_fts (rowid, content, user_key) VALUES (new.id, new.content, 'u' || new.user_id); "
+        "END"
+    ))
+
+
+def run_migrations(engine=engine):
+    """Create missing tables, then apply every migration not yet recorded"""
+    SQLModel.metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE IF NOT EXISTS schema_migrations (name TEXT PRIMARY KEY, applied_at TIMESTAMP NOT NULL)"
+        ))
+        applied = {row[0] for row in conn.execute(text("SELECT name FROM schema_migrations"))}
+
+    for name, func in MIGRATIONS:
+        if name in applied:
+            continue
+        with engine.begin() as conn:
+            func(conn)
+            conn.execute(
+                text("INSERT INTO schema_migrations (name, applied_at) VALUES (:name, :applied_at)"),
+                {"name": name, "applied_at": datetime.now()},
+            )
+        print(f"Applied migration {name}")
+
+
+if __name__ == "__main__":
+    run_migrations()
@@ -0,0 +1,76 @@
+import os
+
+from sqlalchemy import event
+from sqlalchemy.pool import QueuePool
+from sqlmodel import create_engine
+
+# Connection and pragma settings per deployment profile, picked with STORAGE_PROFILE
+PROFILES = {
+    "production": {
+        "echo": False,
+        "journal_mode": "WAL",        # readers don't block the writer and vice versa
+        "synchronous": "NORMAL",      # safe with WAL, fsyncs only at checkpoints
+        "busy_timeout_ms": 5000,      # wait for a competing writer instead of failing
+        "cache_size_kib": 16384,
+        "temp_store": "MEMORY",
+        "mmap_size": 256 * 1024 * 1024,
+        "pool_size": 10,
+        "max_overflow": 20,
+        "pool_timeout": 30,
+    },
+    "development": {
+        "echo": True,
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "busy_timeout_ms": 5000,
+        "cache_size_kib": 2048,
+        "temp_store": "DEFAULT",
+        "mmap_size": 0,
+        "pool_size": 5,
+        "max_overflow": 5,
+        "pool_timeout": 30,
+    },
+}
+
+STORAGE_PROFILE = os.getenv("STORAGE_PROFILE", "production")
+
+
+def get_profile(name: str = STORAGE_PROFILE) -> dict:
+    if name not in PROFILES:
+        raise ValueError(f"Unknown storage profile: {name}")
+    profile = dict(PROFILES[name])
+    if os.getenv("SQL_ECHO") is not None:
+        profile["echo"] = os.getenv("SQL_ECHO").lower() in ("1", "true", "yes")
+    return profile
+
+
+def create_storage_engine(db_path: str, profile_name: str = STORAGE_PROFILE):
+    """SQLite engine with pooled connections and the profile's pragmas applied to each one"""
+    profile = get_profile(profile_name)
+    engine = create_engine(
+        f"sqlite:///{db_path}",
+        echo=profile["echo"],
+        poolclass=QueuePool,
+        pool_size=profile["pool_size"],
+        max_overflow=profile["max_overflow"],
+        pool_timeout=profile["pool_timeout"],
+        connect_args={
+            # Pooled connections are handed to whichever worker thread asks next
+            "check_same_thread": False,
+            "timeout": profile["busy_timeout_ms"] / 1000,
+        },
+    )
+
+    @event.listens_for(engine, "connect")
+    def apply_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute(f"PRAGMA journal_mode={profile['journal_mode']}")
+        cursor.execute(f"PRAGMA synchronous={profile['synchronous']}")
+        cursor.execute(f"PRAGMA busy_timeout={profile['busy_timeout_ms']}")
+        cursor.execute(f"PRAGMA cache_size=-{profile['cache_size_kib']}")
+        cursor.execute(f"PRAGMA temp_store={profile['temp_store']}")
+        cursor.execute(f"PRAGMA mmap_size={profile['mmap_size']}")
+        cursor.execute("PRAGMA foreign_keys=ON")
+        cursor.close()
+
+    return engine
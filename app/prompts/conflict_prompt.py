@@ -6,10 +6,10 @@ facts_prompt = """
 You are a conflict analyzer for a user preference system. Detect contradictions between 
 new user input and their historical facts.
 
-NEW INFORMATION:
+NEW INFORMATION (numbered N1, N2, ...):
 {new_facts}
 
-HISTORICAL FACTS:
+HISTORICAL FACTS (each starts with its id in brackets):
 {old_facts}
 
 TASK:
@@ -25,15 +25,16 @@ Must be direct opposites on the SAME TOPIC:
 ✗ Not conflict: "I like coffee" vs "I like strong coffee"
 ✗ Not conflict: "I'm from Delhi" vs "I work in Delhi"
 
-Return ONLY this format (nothing else):
+Return ONLY this format (nothing else), one line per contradicted historical
+fact giving its id and the number of the new fact that replaces it:
 
 RESPONSE FORMAT:
 yes
-- conflicting fact 1
-- conflicting fact 2
+- 12 -> N1
+- 15 -> N2
 
 OR:
 
 no
 []
-"""
\ No newline at end of file
+"""
@@ -0,0 +1,74 @@
+PROMPT = """
+You maintain a memory of facts about a user. Read the user's message(s) and the
+facts already stored about them, then produce a MEMORY UPDATE.
+
+USER MESSAGE(S):
+\"\"\"{user_message}\"\"\"
+
+STORED FACTS (each starts with its id in brackets):
+{stored_facts}
+
+TASK:
+1. Identify any user facts, preferences, habits, or personal details expressed in
+   the message. For each new fact give:
+   - fact_type (name, age, preference, habit, location, expertise, hobby, etc.)
+   - fact_content (the specific information or value)
+   - source_message (the relevant span from the message)
+   Don't repeat facts that are already stored with the same meaning.
+2. List stored facts that a new fact directly contradicts on the same topic
+   ("I like coffee" vs "I hate coffee"), giving the stored fact's id and the
+   1-based position of the new fact that replaces it. Clarifications, more
+   specific versions and related-but-different facts are NOT contradictions.
+
+Return ONLY a JSON object in this shape:
+{{
+    "new_facts": [
+        {{"fact_type": "...", "fact_content": "...", "source_message": "..."}}
+    ],
+    "superseded": [
+        {{"fact_id": 12, "replaced_by": 1}}
+    ]
+}}
+Use empty lists when there is nothing to add or supersede.
+"""
+
+# JSON schema sent as the structured-output response_format
+RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "memory_update",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {
+                "new_facts": {
+                    "type": "array",
+                    "items": {
+                        "type": "object",
+                        "properties": {
+                            "fact_type": {"type": "string"},
+                            "fact_content": {"type": "string"},
+                            "source_message": {"type": "string"},
+                        },
+                        "required": ["fact_type", "fact_content", "source_message"],
+                        "additionalProperties": False,
+                    },
+                },
+                "superseded": {
+                    "type": "array",
+                    "items": {
+                        "type": "object",
+                        "properties": {
+                            "fact_id": {"type": "integer"},
+                            "replaced_by": {"type": "integer"},
+                        },
+                        "required": ["fact_id", "replaced_by"],
+                        "additionalProperties": False,
+                    },
+                },
+            },
+            "required": ["new_facts", "superseded"],
+            "additionalProperties": False,
+        },
+    },
+}
@@ -0,0 +1,16 @@
+PROMPT = """
+Update the running summary of a conversation between a user and an assistant.
+
+CURRENT SUMMARY:
+\"\"\"{summary}\"\"\"
+
+NEW MESSAGES (older than the ones the assistant still sees verbatim):
+{messages}
+
+Fold the new messages into the summary. Keep what the user asked for, decisions
+made, open questions and any details later turns may refer back to; drop
+pleasantries and repetition. Don't restate personal facts about the user unless
+the conversation depends on them.
+
+Return ONLY the updated summary, at most {max_words} words.
+"""
@@ -1,90 +1,170 @@
-from fastapi import APIRouter, HTTPException, Depends
-from fastapi.responses import JSONResponse, PlainTextResponse
-from app.services.llm import ask_llm, generate_session_name
-from app.services.session import append_chat_interaction, update_session_name, is_first_message
-from app.services.vector_store import add_message_embedding, query_similar_messages
-from app.services.extract_facts import extract_facts
-from app.models.database import UserFact, engine, Session
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from app.services.llm import ask_llm_async, generate_session_name_async, stream_llm
+from app.services.session import ChatContext
+from app.services import retrieval
+from app.services.memory_worker import MemoryJob, memory_worker
+from app.utils.context_builder import build_context
 from app.utils.embeddings import get_embedding
-from app.utils import user_info_check
+from app.utils import http_cache, user_info_check
 from app.schemas.chat import ChatMessage
-from app.services.conflict_detect_update import conflict_check,update_memory
-import uuid 
-import json
-from app.services.session import get_chat_history
+import asyncio
+import logging
+from datetime import datetime
+from typing import Optional
+from app.services.pipeline import Pipeline
 
 router = APIRouter() 
+logger = logging.getLogger(__name__)
 
 @router.post("/")
-def chat(body: ChatMessage):
+async def chat(body: ChatMessage):
     session_id = body.session_id
     username = body.username
     message = body.message
-    
-    try:
-        # Check if this is the first message and generate session name
-        if is_first_message(session_id):
-            try:
-                session_name = generate_session_name(message)
-                update_session_name(session_id, session_name)
-                print(f"Generated session name: {session_name}")
-            except Exception as e:
-                print(f"Failed to generate session name: {e}")
-                # Continue even if name generation fails
-        
-        # Vector DB Query to get the similar memories
-        embedding = get_embedding(message) 
-        similar = query_similar_messages(embedding, username, session_id)
-        similar_text = ". ".join([i[0] for i in similar]) if similar else ""
-        similarity_context = f"ADDITIONAL INFORMATION: {similar_text}" if similar_text else ""
-        
-        #Fetching the chat history
-        chat_history = get_chat_history(session_id)
-        chat_history = append_chat_interaction(session_id, "user", message)
-        recent_messages = "PAST MESSAGES:\n" + "\n".join([f"{msg['role']}: {msg['content']}" for msg in chat_history]) 
-
-        # Fetching the user facts using conflict detector
-        new_facts = extract_facts(message, session_id)
-        print("NEW FAAACTSS:",new_facts)
-        user_facts = user_info_check.get_user_facts(username) 
-        user_facts_dict = [fact.to_dict() for fact in user_facts]
-        print("FAAACTSS:",user_facts_dict)
-        conflict_result = conflict_check(new_facts,user_facts_dict,session_id)
-        update_result = update_memory(
+
+    # Stages that only need the incoming message run concurrently; the final
+    # answer waits only for the context it is built from. Fact extraction,
+    # conflict resolution and indexing of the turn happen in the memory worker.
+    # LLM stages are coroutines on the pooled async client, so a slow backend
+    # holds no thread from the shared executor
+    async def name_session(context):
+        if context.is_first_message:
+            context.rename(await generate_session_name_async(message, user=username))
+
+    def similar_memories(embedding):
+        # Past turns from any of the user's sessions, by meaning and by keyword
+        return retrieval.search(username, message, embedding)
+
+    def recent_history(context):
+        return context.append("user", message)
+
+    def prompt(context, similar_memories, recent_history):
+        # Facts already stored; this turn's facts are picked up by the memory worker
+        return build_context(context.facts, similar_memories, recent_history, context.summary)
+
+    async def store_answer(response, complete=True):
+        context = await pipeline.result("context")
+        if response:
+            context.append("assistant", response)
+        # Let a pending session rename land in the same transaction
+        await pipeline.result("name_session")
+        await asyncio.to_thread(context.flush)
+        if not complete:
+            # A cut-off answer stays in the history but isn't remembered
+            return
+        # Hand the turn to the memory worker
+        await memory_worker.submit(MemoryJob(
             username=username,
-            extracted_facts=new_facts,
-            conflict_result= conflict_result,
-        )
-        user_information = f"USER DETAILS: {str(user_facts)}" if user_facts else ""  
-        
+            session_id=session_id,
+            message=message,
+            response=response,
+        ))
+
+    async def answer(prompt):
         # LLM response
-        final_query = f"{user_information}\n{similarity_context}\n{recent_messages}"
-        response = ask_llm(final_query, session_id)
+        response = await ask_llm_async(prompt, session_id, purpose="answer", user=username)
+        await store_answer(response)
+        return response
 
-        # Update the chat history
-        append_chat_interaction(session_id, "assistant", response)
+    pipeline = (
+        Pipeline()
+        # Session row, recent history and user facts, loaded once for the request
+        .add("context", lambda: ChatContext.load(session_id, username))
+        # Continue even if name generation fails
+        .add("name_session", name_session, deps=["context"], optional=True)
+        .add("embedding", lambda: get_embedding(message))
+        .add("similar_memories", similar_memories, deps=["embedding"])
+        .add("recent_history", recent_history, deps=["context"])
+        .add("prompt", prompt, deps=["context", "similar_memories", "recent_history"])
+    )
+    try:
+        if body.stream:
+            pipeline.start()
+            final_query = await pipeline.result("prompt")
+            tokens = stream_llm(final_query, session_id, purpose="answer", user=username)
+            # Wait for the first token before sending the status, so a backend
+            # that fails up front gets the same 500 as a non-streaming request
+            try:
+                first_token = await anext(tokens, "")
+            except BaseException:
+                pipeline.cancel()
+                raise
+            return StreamingResponse(
+                stream_answer(pipeline, first_token, tokens, store_answer),
+                media_type="text/plain",
+            )
 
-        # Update the vector database
-        msg_id = f"{username}-{session_id}-{uuid.uuid4()}"
-        interaction_text = message+response
-        interaction_embedding = get_embedding(interaction_text)
-        add_message_embedding(interaction_text, interaction_embedding , username, session_id, msg_id)
+        pipeline.add("answer", answer, deps=["prompt"])
+        results = await pipeline.run()
+        return PlainTextResponse(content=results["answer"])
 
-        return PlainTextResponse(content=response)
-        
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
     except Exception as e:
-        print(f"Chat error: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Chat error")
         raise HTTPException(status_code=500, detail=f"Failed to process chat message: {str(e)}")
 
 
+async def stream_answer(pipeline: Pipeline, first_token: str, tokens, store_answer):
+    """Pass tokens through as they arrive, then store the turn.
+
+    The response status is already sent by the time tokens flow, so failures
+    past this point can only be logged. The user message and whatever part of
+    the answer was sent are stored even if the stream breaks or the client
+    goes away.
+    """
+    sent = [first_token]
+    complete = False
+    try:
+        yield first_token
+        async for token in tokens:
+            sent.append(token)
+            yield token
+        complete = True
+    except Exception:
+        logger.exception("Chat stream error")
+    finally:
+        await tokens.aclose()
+        # Shielded: a client disconnect cancels this generator, not the write
+        await asyncio.shield(finish_stream(pipeline, "".join(sent), complete, store_answer))
+
+
+async def finish_stream(pipeline: Pipeline, answer: str, complete: bool, store_answer):
+    try:
+        await store_answer(answer, complete=complete)
+        await pipeline.wait()
+    except Exception:
+        pipeline.cancel()
+        logger.exception("Failed to store streamed chat turn")
+
+
+@router.get("/memory/status")
+def memory_status():
+    """Queue depth and lag of the background memory worker"""
+    return memory_worker.stats()
+
 
 @router.get("/userfacts")
-def get_user_facts(username: str):
-    with Session(engine) as db:
+def get_user_facts(request: Request, username: str, include_history: bool = False, since: Optional[str] = None):
+    """A user's facts, or with since only those added or superseded after that cursor.
+
+    since=0 starts incremental mode; each response's cursor is the next since.
+    """
+    if since is not None:
+        try:
+            since_time = datetime.min if since in ("", "0") else datetime.fromisoformat(since)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid since cursor")
+
+    def build():
+        if since is None:
+            # include_history also returns superseded facts, for auditing
+            facts = user_info_check.get_user_facts(username, include_superseded=include_history)
+            return [fact.to_dict() for fact in facts]
+        facts = user_info_check.get_changed_facts(username, since_time)
+        cursor = facts[-1].updated_at.isoformat() if facts else since
+        return {"facts": [fact.to_dict() for fact in facts], "cursor": cursor}
 
-        facts = user_info_check.get_user_facts(username)
-        return facts  # If SQLModel, you can use .dict()
\ No newline at end of file
+    tag = http_cache.etag("facts", username, include_history, since, *user_info_check.facts_version(username))
+    return http_cache.conditional(request, tag, build)
\ No newline at end of file
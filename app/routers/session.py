@@ -1,25 +1,50 @@
-from fastapi import APIRouter, HTTPException
-from app.services.session import create_or_get_session, get_session_data, get_sessions_for_user
+from typing import Optional
+
+from fastapi import APIRouter, HTTPException, Query, Request
+from app.services.session import (
+    create_or_get_session,
+    get_session_data,
+    get_sessions_for_user,
+    session_version,
+    sessions_version,
+)
 from app.schemas.session import SessionCreate
+from app.utils import http_cache
 
 router = APIRouter()
 
+# Upper bound for ?limit= on the session list
+MAX_PAGE_SIZE = 200
+
 @router.get("/get/{session_id}")
-def session_data(session_id: str):
-    try:
-        data = get_session_data(session_id)
-        return data
-    except Exception as e:
-        # Return empty history instead of error for new sessions
-        return {"messages": []}
+def session_data(request: Request, session_id: str, since: Optional[int] = None):
+    """Chat history; with since (a previous response's cursor) only the newer messages"""
+    def build():
+        try:
+            return get_session_data(session_id, since)
+        except Exception as e:
+            # Return empty history instead of error for new sessions
+            return {"messages": [], "cursor": -1 if since is None else since}
+
+    # The query parameters pick the payload, so they are part of the tag too
+    tag = http_cache.etag("messages", session_id, since, session_version(session_id))
+    return http_cache.conditional(request, tag, build)
 
 @router.get("/{username}")
-def sessions_for_user(username: str):
-    sessions = get_sessions_for_user(username)
-    # Return empty list instead of 404 when user has no sessions
-    if not sessions:
-        return {"username": username, "sessions": []}
-    return {"username": username, "sessions": sessions}
+def sessions_for_user(
+    request: Request,
+    username: str,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[int] = None,
+):
+    """A user's sessions; with limit, one page at a time, following next_cursor"""
+    def build():
+        # Return empty list instead of 404 when user has no sessions
+        page = get_sessions_for_user(username, limit=limit, after=cursor)
+        return {"username": username, **page}
+
+    tag = http_cache.etag("sessions", username, limit, cursor, *sessions_version(username))
+    return http_cache.conditional(request, tag, build)
 
 
 @router.post("/")
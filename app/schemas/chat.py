@@ -6,3 +6,4 @@ class ChatMessage(BaseModel):
     username: str
     message: str
     override_conflict: Optional[bool] = None  # User's response to conflict prompt
+    stream: Optional[bool] = False  # Stream the answer as chunked text while it is generated
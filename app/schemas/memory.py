@@ -0,0 +1,22 @@
+from pydantic import BaseModel, ConfigDict
+from typing import List, Optional
+
+class ExtractedFact(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+
+    fact_type: str
+    fact_content: str
+    source_message: str
+
+class Supersession(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+
+    fact_id: int
+    replaced_by: Optional[int] = None  # 1-based position in new_facts
+
+class MemoryUpdate(BaseModel):
+    """Structured output of the single-pass memory prompt"""
+    model_config = ConfigDict(extra="forbid")
+
+    new_facts: List[ExtractedFact]
+    superseded: List[Supersession]
@@ -1,24 +1,33 @@
-from sqlmodel import Session as DBSession, select
+from sqlmodel import Session as DBSession
+from sqlalchemy.exc import IntegrityError
 from app.models.database import User, engine
+from app.services.user_directory import user_directory
 import hashlib
 
 def hash_password(password: str) -> str:
     return hashlib.sha256(password.encode()).hexdigest()
 
 def signup(username: str, password: str):
+    if user_directory.get_id(username) is not None:
+        raise ValueError("User exists")
     with DBSession(engine) as db:
-        existing = db.exec(select(User).where(User.username == username)).first()
-        if existing:
-            raise ValueError("User exists")
         user = User(username=username, password_hash=hash_password(password))
         db.add(user)
-        db.commit()
+        try:
+            db.commit()
+        except IntegrityError:
+            # Lost a race with a concurrent signup for the same username
+            raise ValueError("User exists")
         db.refresh(user)
+        user_directory.put(user.username, user.id)
         return user
 
 def verify_login(username: str, password: str):
+    user_id = user_directory.get_id(username)
+    if user_id is None:
+        return False
     with DBSession(engine) as db:
-        user = db.exec(select(User).where(User.username == username)).first()
+        user = db.get(User, user_id)
         if user is None or user.password_hash != hash_password(password):
             return False
         return True
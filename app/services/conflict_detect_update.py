@@ -1,9 +1,26 @@
-from typing import List, Dict, Tuple
-from dataclasses import dataclass
+from typing import List, Dict, Optional, Set, Tuple
+from dataclasses import dataclass, field
+from datetime import datetime
+import os
+import re
+from sqlmodel import select
 from app.prompts import conflict_prompt
 from app.services import llm
 from app.services.extract_facts import extract_facts
+from app.services import vector_store
 from app.models.database import UserFact, engine, Session
+from app.utils.embeddings import get_embeddings
+
+# Only the stored facts nearest to the new ones are sent to the conflict LLM call
+CONFLICT_TOP_K = int(os.getenv("CONFLICT_TOP_K", "5"))
+CONFLICT_SIMILARITY_THRESHOLD = float(os.getenv("CONFLICT_SIMILARITY_THRESHOLD", "0.4"))
+CONFLICT_MATCH_FACT_TYPE = os.getenv("CONFLICT_MATCH_FACT_TYPE", "false").lower() in ("1", "true", "yes")
+
+CONFLICT_CACHE_TEMPLATE = llm.template_id("conflict_check", conflict_prompt.facts_prompt)
+
+# Users whose fact index has been reconciled with the database by this process;
+# from then on writes keep it in sync, so it isn't diffed again
+_backfilled_users: Set[str] = set()
 
 
 @dataclass
@@ -11,152 +28,269 @@ class ConflictResult:
     has_conflict: bool
     conflicting_facts: List[str]
     raw_response: str
+    # Historical fact id -> index into the new facts of the fact replacing it
+    # (None when the model didn't say which one)
+    supersessions: Dict[int, Optional[int]] = field(default_factory=dict)
+
+
+SUPERSESSION_LINE = re.compile(r"\[?(\d+)\]?(?:\s*->\s*N?(\d+))?", re.IGNORECASE)
+
+
+def is_conflict_answer(response: str) -> bool:
+    # Only well-formed yes/no answers are worth caching
+    return response.strip().split('\n')[0].lower().strip() in ('yes', 'no')
 
 
-def parse_conflict_response(response: str) -> ConflictResult:
+def parse_conflict_response(response: str, candidate_ids: Set[int] = None) -> ConflictResult:
     lines = response.strip().split('\n')
     has_conflict = lines[0].lower().strip() == 'yes'
     
     conflicting_facts = []
+    supersessions = {}
     if has_conflict and len(lines) > 1:
-        # Extract facts from list format
+        # Extract "- <fact id> -> N<new fact number>" entries from list format
         for line in lines[1:]:
             fact = line.strip().lstrip('- ').strip()
-            if fact and fact != '[]':
-                conflicting_facts.append(fact)
+            if not fact or fact == '[]':
+                continue
+            conflicting_facts.append(fact)
+            match = SUPERSESSION_LINE.match(fact)
+            if not match:
+                continue
+            fact_id = int(match.group(1))
+            # Ignore ids that weren't offered, so a hallucinated id can't touch other facts
+            if candidate_ids is not None and fact_id not in candidate_ids:
+                continue
+            supersessions[fact_id] = int(match.group(2)) - 1 if match.group(2) else None
     
     return ConflictResult(
-        has_conflict=has_conflict,
+        has_conflict=has_conflict and bool(supersessions),
         conflicting_facts=conflicting_facts,
-        raw_response=response
+        raw_response=response,
+        supersessions=supersessions,
     )
 
 
+def index_facts(username: str, facts: List[UserFact]):
+    """Embed facts into the user's fact index; done once, when they are written"""
+    facts = [fact for fact in facts if fact.id is not None]
+    if not facts:
+        return
+    vector_store.add_fact_embeddings(
+        username,
+        [fact.id for fact in facts],
+        [fact.fact_content for fact in facts],
+        [fact.fact_type for fact in facts],
+        get_embeddings([fact.fact_content for fact in facts]),
+    )
+
+
+def _ensure_fact_index(username: str, stored_facts: List[UserFact]):
+    # Facts written before the index existed are embedded the first time the
+    # user's index is needed, once per process
+    if username in _backfilled_users:
+        return
+    indexed = vector_store.indexed_fact_ids(username)
+    stale = indexed - {fact.id for fact in stored_facts}
+    vector_store.delete_fact_embeddings(username, list(stale))
+    index_facts(username, [fact for fact in stored_facts if fact.id not in indexed])
+    _backfilled_users.add(username)
+
+
+def _nearest_facts(
+    username: str,
+    query_texts: List[str],
+    stored_facts: List[UserFact],
+    fact_types: List[Optional[str]],
+    top_k: int,
+    threshold: float,
+) -> List[Dict]:
+    if not query_texts or not stored_facts:
+        return []
+    _ensure_fact_index(username, stored_facts)
+
+    by_id = {fact.id: fact for fact in stored_facts}
+    scores = {}
+    for embedding, fact_type in zip(get_embeddings(query_texts), fact_types):
+        for fact_id, similarity in vector_store.query_similar_facts(embedding, username, top_k, fact_type):
+            if similarity >= threshold and fact_id in by_id:
+                scores[fact_id] = max(similarity, scores.get(fact_id, 0.0))
+
+    ranked = sorted(scores, key=scores.get, reverse=True)[:top_k * len(query_texts)]
+    return [by_id[fact_id].to_dict() for fact_id in ranked]
+
+
+def find_conflict_candidates(
+    username: str,
+    new_facts: List[Dict],
+    stored_facts: List[UserFact],
+    top_k: int = CONFLICT_TOP_K,
+    threshold: float = CONFLICT_SIMILARITY_THRESHOLD,
+    match_fact_type: bool = CONFLICT_MATCH_FACT_TYPE,
+) -> List[Dict]:
+    """Stored facts similar enough to a new fact to possibly contradict it"""
+    new_facts = [fact for fact in new_facts if fact.get('fact_content')]
+    return _nearest_facts(
+        username,
+        [fact['fact_content'] for fact in new_facts],
+        stored_facts,
+        [fact.get('fact_type') if match_fact_type else None for fact in new_facts],
+        top_k,
+        threshold,
+    )
+
+
+def find_relevant_facts(
+    username: str,
+    message: str,
+    stored_facts: List[UserFact],
+    top_k: int = CONFLICT_TOP_K,
+    threshold: float = CONFLICT_SIMILARITY_THRESHOLD,
+) -> List[Dict]:
+    """Stored facts close to a raw message, before any facts are extracted from it"""
+    # Batched turns arrive newline-joined; each turn is its own query
+    lines = [line for line in message.split("\n") if line.strip()]
+    return _nearest_facts(username, lines, stored_facts, [None] * len(lines), top_k, threshold)
+
+
 def conflict_check(
-    new_facts: str, 
-    old_facts: str, 
-    session_id: str
+    new_facts: List[Dict],
+    old_facts: List[Dict],
+    session_id: str,
+    username: str = None
 ) -> ConflictResult:
-    
+    # Nothing new, or nothing close enough to contradict: no LLM call needed
+    if not new_facts or not old_facts:
+        return ConflictResult(has_conflict=False, conflicting_facts=[], raw_response="")
+
+    formatted_new = format_new_facts(new_facts)
+    formatted_old = format_stored_facts(old_facts)
     conflict_prompt_text = conflict_prompt.facts_prompt.format(
-        new_facts=new_facts,
-        old_facts=old_facts,
+        new_facts=formatted_new,
+        old_facts=formatted_old,
     )
     
-    response = llm.ask_llm(conflict_prompt_text, session_id)
-    result = parse_conflict_response(response)
+    response = llm.ask_llm(
+        conflict_prompt_text,
+        session_id,
+        cache_template=CONFLICT_CACHE_TEMPLATE,
+        cache_input=f"{formatted_new}\n---\n{formatted_old}",
+        cache_if=is_conflict_answer,
+        purpose="conflict",
+        user=username,
+    )
+    result = parse_conflict_response(response, {fact['id'] for fact in old_facts})
     
     return result
 
 
+def format_new_facts(new_facts: List[Dict]) -> str:
+    return "\n".join(
+        f"N{i}. ({fact.get('fact_type')}) {fact.get('fact_content')}" for i, fact in enumerate(new_facts, start=1)
+    )
+
+
+def format_stored_facts(facts: List[Dict]) -> str:
+    return "\n".join(f"[{fact['id']}] ({fact['fact_type']}) {fact['fact_content']}" for fact in facts)
+
+
 def update_memory(
     username: str,
     extracted_facts: List[Dict],
     conflict_result: ConflictResult,
     update_strategy: str = "replace"
 ) -> Dict[str, any]:
-    
-    if not conflict_result.has_conflict:
-        # No conflict: straightforward addition
-        return _add_new_facts(username, extracted_facts)
-    
-    # Handle conflicts based on strategy
-    if update_strategy == "replace":
-        
-        return _replace_conflicting_facts(
-            username, 
-            extracted_facts, 
-            conflict_result.conflicting_facts
-        )
-        
-    else:
+    """Store new facts and supersede the ones they contradict, in one transaction"""
+    if update_strategy != "replace":
         raise ValueError(f"Unknown update strategy: {update_strategy}")
 
-
-def _add_new_facts(
-    username: str, 
-    extracted_facts: List[Dict]
-) -> Dict[str, any]:
-    """Add new facts without conflicts."""
+    supersessions = conflict_result.supersessions if conflict_result.has_conflict else {}
     try:
-        with Session(engine) as db:
-            added_facts = []
-            for fact in extracted_facts:
-                if fact.get('fact_content') is not None and fact.get('source_message') is not None:
-                    user_fact = UserFact(
-                        user_name=username,
-                        fact_type=fact.get('fact_type'),
-                        fact_content=fact.get('fact_content'),
-                        source_message=fact.get('source_message')
-                    )
-                    db.add(user_fact)
-                    added_facts.append(user_fact)
-            
-                    db.commit()
-        
-        return {
-            "status": "success",
-            "action": "added",
-            "facts":str(extracted_facts),
-            "facts_count": len(added_facts),
-            "message": f"Added {len(added_facts)} new facts successfully"
-        }
+        return _apply_fact_changes(username, extracted_facts, supersessions)
     except Exception as e:
         return {
-            "function":"add new",
+            "function": "apply fact changes",
             "status": "error",
             "action": "failed",
             "message": str(e)
         }
 
 
-def _replace_conflicting_facts(
+def _apply_fact_changes(
     username: str,
     extracted_facts: List[Dict],
-    conflicting_facts: List[str]
+    supersessions: Dict[int, Optional[int]]
 ) -> Dict[str, any]:
-    """Replace old conflicting facts with new ones."""
-    try:
-        with Session(engine) as db:
-            # Find and delete old conflicting facts
-            for old_fact in conflicting_facts:
-                db.query(UserFact).filter(
-                    UserFact.user_name == username,
-                    UserFact.fact_content.contains(old_fact)
-                ).delete()
-            
-            # Add new facts
-            added_facts = []
-            for fact in extracted_facts:
-                if fact.get('fact_content') is not None and fact.get('source_message') is not None:
-                    user_fact = UserFact(
-                        user_name=username,
-                        fact_type=fact.get('fact_type'),
-                        fact_content=fact.get('fact_content'),
-                        source_message=fact.get('source_message')
-                    )
-                    db.add(user_fact)
-                    added_facts.append(user_fact)
-            
-            db.commit()
-        
-        return {
-            "status": "success",
-            "action": "replaced",
-            "new_facts_count": len(added_facts),
-            "superseded_facts": conflicting_facts,
-            "message": f"Replaced {len(conflicting_facts)} conflicting fact(s) with {len(added_facts)} new fact(s)"
-        }
-    except Exception as e:
-        return {
-            "function":"replace conflicting",
-            "status": "error",
-            "action": "failed",
-            "message": str(e)
-        }
+    """Insert new facts and mark superseded ones by id, committing once.
+
+    Superseded facts are kept, with superseded_by pointing at their
+    replacement, so a user's fact history can be audited.
+    """
+    valid_facts = [
+        fact for fact in extracted_facts
+        if fact.get('fact_content') is not None and fact.get('source_message') is not None
+    ]
+    if not valid_facts:
+        return {"status": "success", "action": "none", "facts_count": 0, "message": "No new facts"}
 
+    now = datetime.now()
+    with Session(engine) as db:
+        added_facts = [
+            UserFact(
+                user_name=username,
+                fact_type=fact.get('fact_type'),
+                fact_content=fact.get('fact_content'),
+                source_message=fact.get('source_message'),
+                valid_from=now,
+                updated_at=now,
+            )
+            for fact in valid_facts
+        ]
+        db.add_all(added_facts)
+        # Assigns ids to the new facts inside the same transaction
+        db.flush()
 
+        superseded_ids = []
+        if supersessions:
+            old_facts = db.exec(select(UserFact).where(
+                UserFact.user_name == username,
+                UserFact.id.in_(list(supersessions)),
+                UserFact.superseded_by.is_(None)
+            )).all()
+            for old_fact in old_facts:
+                replacement = _replacement_for(old_fact, supersessions[old_fact.id], added_facts)
+                old_fact.superseded_by = replacement.id
+                old_fact.superseded_at = now
+                old_fact.updated_at = now
+                db.add(old_fact)
+                superseded_ids.append(old_fact.id)
 
+        db.commit()
+        for user_fact in added_facts:
+            db.refresh(user_fact)
+        try:
+            vector_store.delete_fact_embeddings(username, superseded_ids)
+            index_facts(username, added_facts)
+        except Exception:
+            # The index is now behind the database; reconcile it on next use
+            _backfilled_users.discard(username)
+            raise
 
+    return {
+        "status": "success",
+        "action": "replaced" if superseded_ids else "added",
+        "facts": str(extracted_facts),
+        "facts_count": len(added_facts),
+        "superseded_fact_ids": superseded_ids,
+        "message": f"Added {len(added_facts)} new fact(s), superseded {len(superseded_ids)}"
+    }
 
 
+def _replacement_for(old_fact: UserFact, index: Optional[int], added_facts: List[UserFact]) -> UserFact:
+    if index is not None and 0 <= index < len(added_facts):
+        return added_facts[index]
+    # The model didn't say which new fact replaces it: prefer one on the same topic
+    for fact in added_facts:
+        if fact.fact_type == old_fact.fact_type:
+            return fact
+    return added_facts[0]
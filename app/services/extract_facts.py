@@ -2,9 +2,11 @@ from app.prompts import extract_facts_prompt
 from app.services import llm
 import json
 
-def extract_facts(user_message: str,session_id) -> list:
+CACHE_TEMPLATE = llm.template_id("extract_facts", extract_facts_prompt.PROMPT)
+
+def extract_facts(user_message: str,session_id,username: str = None) -> list:
     prompt = extract_facts_prompt.PROMPT.format(user_message=user_message)
-    llm_response = llm.ask_llm(prompt,session_id)
+    llm_response = llm.ask_llm(prompt,session_id,cache_template=CACHE_TEMPLATE,cache_input=user_message,cache_if=llm.is_json,purpose="extraction",user=username)
     # Parse llm_response as JSON and return
     return json.loads(llm_response)
     
@@ -0,0 +1,93 @@
+"""Keyword (BM25) search over a user's stored interactions, in SQLite FTS5.
+
+Complements the vector store: dense similarity finds paraphrases but misses
+exact names, numbers and identifiers, which a term match finds directly.
+Writes go to the interaction table; the interaction_fts index follows via
+triggers (see migration 0006).
+"""
+import re
+from typing import Optional
+
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+from app.models.database import engine
+from app.services.user_directory import user_directory
+
+# Terms per query; the rest of a very long message adds little but cost
+MAX_QUERY_TERMS = 32
+# Too common to tell interactions apart, but each one matched costs a posting list read
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "but", "by", "can", "do", "for", "from", "have", "how",
+    "i", "in", "is", "it", "me", "my", "of", "on", "or", "so", "that", "the", "this", "to", "was",
+    "what", "when", "where", "which", "who", "why", "will", "with", "you", "your",
+}
+
+
+def match_expression(query: str, user_id: int) -> Optional[str]:
+    """FTS5 query for any of the message's terms, restricted to one user's rows"""
+    terms = []
+    for term in re.findall(r"\w+", query.lower()):
+        if term not in STOPWORDS and term not in terms:
+            terms.append(term)
+        if len(terms) == MAX_QUERY_TERMS:
+            break
+    if not terms:
+        return None
+    # \w+ tokens never contain quotes, so quoting makes each one a plain term
+    return f"user_key:u{user_id} AND (" + " OR ".join(f'"{term}"' for term in terms) + ")"
+
+
+def add_interactions(texts: list[str], usernames: list[str], session_ids: list[str], doc_ids: list[str], upsert: bool = False):
+    """Store interactions for keyword search; with upsert=True existing doc_ids are overwritten"""
+    rows = []
+    for content, username, session_id, doc_id in zip(texts, usernames, session_ids, doc_ids):
+        user_id = user_directory.get_id(username)
+        if user_id is not None:
+            rows.append({"doc_id": doc_id, "user_id": user_id, "session_id": session_id, "content": content})
+    if not rows:
+        return
+    conflict = "DO UPDATE SET content = excluded.content, session_id = excluded.session_id" if upsert else "DO NOTHING"
+    with engine.begin() as conn:
+        conn.execute(
+            text(
+                "INSERT INTO interaction (doc_id, user_id, session_id, content, created_at) "
+                f"VALUES (:doc_id, :user_id, :session_id, :content, CURRENT_TIMESTAMP) ON CONFLICT (doc_id) {conflict}"
+            ),
+            rows,
+        )
+
+
+def search(username: str, query: str, limit: int = 20) -> list[tuple]:
+    """Best keyword matches as (doc_id, content, session_id, bm25) tuples, best first.
+
+    bm25 scores are negative; lower is a better match.
+    """
+    user_id = user_directory.get_id(username)
+    if user_id is None:
+        return []
+    expression = match_expression(query, user_id)
+    if expression is None:
+        return []
+    try:
+        with engine.connect() as conn:
+            rows = conn.execute(
+                text(
+                    "SELECT i.doc_id, i.content, i.session_id, bm25(interaction_fts, 1.0, 0.0) AS score "
+                    "FROM interaction_fts JOIN interaction i ON i.id = interaction_fts.rowid "
+                    "WHERE interaction_fts MATCH :expression ORDER BY score LIMIT :limit"
+                ),
+                {"expression": expression, "limit": limit},
+            ).all()
+    except OperationalError as e:
+        # No FTS5 table (SQLite built without it): keyword search is simply off
+        if "no such table" in str(e):
+            return []
+        raise
+    return [tuple(row) for row in rows]
+
+
+def clear():
+    """Drop every indexed interaction, e.g. before a rebuild"""
+    with engine.begin() as conn:
+        conn.execute(text("DELETE FROM interaction"))
@@ -1,27 +1,766 @@
-import requests
-from dotenv import load_dotenv 
-import os 
+import asyncio
+import hashlib
+import json
+import logging
+import random
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Callable, Optional
+import httpx
+from dotenv import load_dotenv
+import os
+from app.utils import metrics
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 grok_key = os.getenv("GROKKEY")
 
-def ask_llm(prompt: str, session_id: str):
-    url = "https://openrouter.ai/api/v1/chat/completions"
-    api_key = grok_key
-    payload = {
-        "model": "x-ai/grok-4-fast",
-        "messages": [{"role": "user", "content": prompt}],
-    }
-    headers = {"Authorization": f"Bearer {api_key}"}
-    response = requests.post(url, json=payload, headers=headers)
-    return response.json()["choices"][0]["message"]["content"]
+# Any OpenAI-compatible chat completions server works here, e.g. the local
+# stub in benchmarks/stub_llm.py for tests and benchmarks.
+LLM_BASE_URL = os.getenv("LLM_BASE_URL", "https://openrouter.ai/api/v1")
+LLM_MODEL = os.getenv("LLM_MODEL", "x-ai/grok-4-fast")
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "60"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "20"))
+# Response cache for deterministic helper prompts (never the chat answer)
+LLM_CACHE_SIZE = int(os.getenv("LLM_CACHE_SIZE", "2048"))
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", "86400"))
+# SQLite file for a persistent tier shared across restarts; unset keeps it in memory only
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH")
+# Expired rows are deleted from the persistent tier once every this many writes
+LLM_CACHE_PRUNE_EVERY = int(os.getenv("LLM_CACHE_PRUNE_EVERY", "500"))
+# Admission control: calls in flight to the backend at once (0 disables the limiter).
+# The cap adapts between LLM_MIN_CONCURRENCY and this value when the backend returns 429.
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))
+LLM_MIN_CONCURRENCY = int(os.getenv("LLM_MIN_CONCURRENCY", "1"))
 
-def generate_session_name(first_message: str) -> str:
-    """Generate a short, descriptive session name based on the first message"""
+# Lower runs first. The chat answer is latency-critical; memory work can wait.
+PRIORITY_INTERACTIVE = 0
+PRIORITY_NORMAL = 1
+PRIORITY_BACKGROUND = 2
+PURPOSE_PRIORITY = {
+    "answer": PRIORITY_INTERACTIVE,
+    "naming": PRIORITY_NORMAL,
+    "extraction": PRIORITY_BACKGROUND,
+    "conflict": PRIORITY_BACKGROUND,
+    "memory_update": PRIORITY_BACKGROUND,
+    "summary": PRIORITY_BACKGROUND,
+}
+PRIORITY_NAMES = {PRIORITY_INTERACTIVE: "interactive", PRIORITY_NORMAL: "normal", PRIORITY_BACKGROUND: "background"}
+
+RETRY_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
+
+class LLMError(Exception):
+    pass
+
+
+def template_id(name: str, template: str) -> str:
+    """Cache namespace for a prompt template; editing the template starts a new one"""
+    return f"{name}-{hashlib.sha256(template.encode('utf-8')).hexdigest()[:12]}"
+
+
+def normalize_input(text: str) -> str:
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def is_json(text: str) -> bool:
     try:
-        url = "https://openrouter.ai/api/v1/chat/completions"
-        api_key = grok_key
-        prompt = f"""Generate a very short (2-5 words) title for a chat conversation that starts with this message: "{first_message}"
+        json.loads(text)
+    except ValueError:
+        return False
+    return True
+
+
+class ResponseCache:
+    """LRU of completions with a TTL, optionally backed by a SQLite file.
+
+    Only calls that pass a cache template are looked up, keyed by (model,
+    template id, normalized input, request options); the template id stands in
+    for the prompt text around the input. Lookups check memory first, then the
+    persistent tier, whose hits are promoted back into memory. The SQLite file
+    is opened on first use, so building a client touches no disk.
+    """
+
+    def __init__(
+        self,
+        max_size: int = LLM_CACHE_SIZE,
+        ttl: float = LLM_CACHE_TTL,
+        path: Optional[str] = LLM_CACHE_PATH,
+        prune_every: int = LLM_CACHE_PRUNE_EVERY,
+    ):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.prune_every = max(1, prune_every)
+        self.writes = 0
+        self.entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.path = path or None
+        self.db = None
+
+    @property
+    def persistent(self) -> bool:
+        return self.path is not None
+
+    def _disk(self) -> Optional[sqlite3.Connection]:
+        # Called with the lock held
+        if self.db is None and self.path is not None:
+            self.db = sqlite3.connect(self.path, check_same_thread=False)
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache (key TEXT PRIMARY KEY, response TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+            self.db.execute("CREATE INDEX IF NOT EXISTS ix_llm_cache_created_at ON llm_cache (created_at)")
+            self.db.commit()
+            # Clear out whatever expired while the process was down
+            self._prune()
+        return self.db
+
+    @staticmethod
+    def key(model: str, template: str, text: str, options: dict) -> str:
+        raw = json.dumps([model, template, normalize_input(text), options], sort_keys=True)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and time.time() - entry[0] <= self.ttl:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self.entries[key]
+            row = None
+            db = self._disk()
+            if db is not None:
+                row = db.execute(
+                    "SELECT created_at, response FROM llm_cache WHERE key = ? AND created_at >= ?",
+                    (key, time.time() - self.ttl),
+                ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            self._remember(key, row[0], row[1])
+            return row[1]
+
+    def put(self, key: str, response: str):
+        now = time.time()
+        with self.lock:
+            self._remember(key, now, response)
+            db = self._disk()
+            if db is not None:
+                db.execute(
+                    "INSERT OR REPLACE INTO llm_cache (key, response, created_at) VALUES (?, ?, ?)",
+                    (key, response, now),
+                )
+                self.writes += 1
+                # Reads already ignore expired rows, so deleting them can wait
+                if self.writes % self.prune_every == 0:
+                    self._prune()
+                db.commit()
+
+    async def aget(self, key: str) -> Optional[str]:
+        """get() for the event loop; the SQLite tier is read in a worker thread"""
+        if not self.persistent:
+            return self.get(key)
+        return await asyncio.to_thread(self.get, key)
+
+    async def aput(self, key: str, response: str):
+        if self.persistent:
+            await asyncio.to_thread(self.put, key, response)
+        else:
+            self.put(key, response)
+
+    def _prune(self):
+        self.db.execute("DELETE FROM llm_cache WHERE created_at < ?", (time.time() - self.ttl,))
+        self.db.commit()
+
+    def _remember(self, key: str, created_at: float, response: str):
+        if self.max_size <= 0:
+            return
+        self.entries[key] = (created_at, response)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            "size": len(self.entries),
+            "max_size": self.max_size,
+            "persistent": self.persistent,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.hits + self.disk_hits) / lookups, 4) if lookups else 0.0,
+            "upstream_calls_saved": self.hits + self.disk_hits,
+        }
+
+    def close(self):
+        if self.db is not None:
+            self.db.close()
+            self.db = None
+
+
+def _resolve(future):
+    if not future.done():
+        future.set_result(None)
+
+
+class _Waiter:
+    __slots__ = ("priority", "user", "enqueued_at", "granted", "epoch", "event", "loop", "future")
+
+    def __init__(self, priority: int, user: str, loop=None):
+        self.priority = priority
+        self.user = user
+        self.enqueued_at = time.monotonic()
+        self.granted = False
+        self.epoch = 0
+        self.loop = loop
+        self.future = loop.create_future() if loop is not None else None
+        self.event = threading.Event() if loop is None else None
+
+    def wake(self):
+        self.granted = True
+        if self.future is not None:
+            self.loop.call_soon_threadsafe(_resolve, self.future)
+        else:
+            self.event.set()
+
+
+class AdmissionController:
+    """Caps the LLM calls in flight, shared by sync and async callers.
+
+    Waiting calls are admitted by priority class, and within a class
+    round-robin across users, so one user's burst of memory work can't hold
+    back everyone else's and background calls always yield to chat answers.
+    The cap itself is adaptive (AIMD): halved when the backend answers 429,
+    raised by one after a full window of calls succeeds. Admission hands out
+    the current epoch (the number of cuts so far); a 429 on a call admitted
+    before the latest cut was sent under the old cap and doesn't cut again,
+    so a burst of 429s halves the cap once, not once per call.
+    """
+
+    def __init__(self, max_concurrency: int = LLM_MAX_CONCURRENCY, min_concurrency: int = LLM_MIN_CONCURRENCY):
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = max(1, min(min_concurrency, max_concurrency))
+        self.limit = max_concurrency
+        self.in_flight = 0
+        self.successes = 0
+        self.throttled = 0
+        self.epoch = 0
+        self.queues = {priority: OrderedDict() for priority in PRIORITY_NAMES}
+        self.lock = threading.Lock()
+        self._publish()
+
+    def _queued(self, priority: int) -> int:
+        return sum(len(waiters) for waiters in self.queues[priority].values())
+
+    def _publish(self):
+        metrics.llm_in_flight.set(self.in_flight)
+        metrics.llm_concurrency_limit.set(self.limit)
+        for priority, name in PRIORITY_NAMES.items():
+            metrics.llm_queue_depth.set(self._queued(priority), priority=name)
+
+    def _admit_now(self, priority: int) -> bool:
+        # Never overtake a waiter of the same or a more urgent class
+        return self.in_flight < self.limit and not any(self.queues[p] for p in self.queues if p <= priority)
+
+    def _grant(self, waiter: _Waiter):
+        self.in_flight += 1
+        waiter.epoch = self.epoch
+        metrics.llm_queue_wait_seconds.observe(
+            time.monotonic() - waiter.enqueued_at, priority=PRIORITY_NAMES[waiter.priority]
+        )
+        waiter.wake()
+
+    def _dispatch(self):
+        while self.in_flight < self.limit:
+            priority = next((p for p in sorted(self.queues) if self.queues[p]), None)
+            if priority is None:
+                break
+            users = self.queues[priority]
+            user, waiters = next(iter(users.items()))
+            waiter = waiters.popleft()
+            if waiters:
+                users.move_to_end(user)
+            else:
+                del users[user]
+            self._grant(waiter)
+        self._publish()
+
+    def _enqueue(self, waiter: _Waiter):
+        self.queues[waiter.priority].setdefault(waiter.user, deque()).append(waiter)
+        self._publish()
+
+    def _withdraw(self, waiter: _Waiter):
+        users = self.queues[waiter.priority]
+        waiters = users.get(waiter.user)
+        if waiters is not None and waiter in waiters:
+            waiters.remove(waiter)
+            if not waiters:
+                del users[waiter.user]
+        self._publish()
+
+    def _try_admit(self, priority: int) -> bool:
+        if not self._admit_now(priority):
+            return False
+        self.in_flight += 1
+        metrics.llm_queue_wait_seconds.observe(0.0, priority=PRIORITY_NAMES[priority])
+        self._publish()
+        return True
+
+    def acquire(self, priority: int, user: str, timeout: float) -> int:
+        """Block until a slot is free and return the epoch it was admitted in.
+
+        Raises LLMError if no slot frees up within timeout.
+        """
+        if self.max_concurrency <= 0:
+            return 0
+        with self.lock:
+            if self._try_admit(priority):
+                return self.epoch
+            waiter = _Waiter(priority, user)
+            self._enqueue(waiter)
+        waiter.event.wait(max(0.0, timeout))
+        with self.lock:
+            if not waiter.granted:
+                self._withdraw(waiter)
+                raise LLMError("LLM call timed out waiting for admission")
+        return waiter.epoch
+
+    async def aacquire(self, priority: int, user: str, timeout: float) -> int:
+        if self.max_concurrency <= 0:
+            return 0
+        with self.lock:
+            if self._try_admit(priority):
+                return self.epoch
+            waiter = _Waiter(priority, user, asyncio.get_running_loop())
+            self._enqueue(waiter)
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), max(0.0, timeout))
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            with self.lock:
+                granted = waiter.granted
+                if not granted:
+                    self._withdraw(waiter)
+            if isinstance(e, asyncio.CancelledError):
+                # A slot granted while we were being cancelled goes to the next waiter
+                if granted:
+                    self.release()
+                raise
+            if not granted:
+                raise LLMError("LLM call timed out waiting for admission") from e
+        return waiter.epoch
+
+    def release(self):
+        if self.max_concurrency <= 0:
+            return
+        with self.lock:
+            self.in_flight -= 1
+            self._dispatch()
+
+    def on_success(self):
+        if self.max_concurrency <= 0:
+            return
+        with self.lock:
+            self.successes += 1
+            if self.limit < self.max_concurrency and self.successes >= self.limit:
+                self.limit += 1
+                self.successes = 0
+                self._dispatch()
+
+    def on_throttled(self, epoch: int = None):
+        """Record a 429 on a call admitted in epoch; only the first since the latest cut shrinks the cap"""
+        metrics.llm_throttled_total.inc()
+        if self.max_concurrency <= 0:
+            return
+        with self.lock:
+            self.throttled += 1
+            if epoch is not None and epoch < self.epoch:
+                return
+            self.epoch += 1
+            self.limit = max(self.min_concurrency, self.limit // 2)
+            self.successes = 0
+            self._publish()
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "limit": self.limit,
+                "max_concurrency": self.max_concurrency,
+                "in_flight": self.in_flight,
+                "throttled": self.throttled,
+                "queued": {name: self._queued(priority) for priority, name in PRIORITY_NAMES.items()},
+            }
+
+
+def _retry_after(response: httpx.Response) -> Optional[float]:
+    try:
+        return float(response.headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+class LLMClient:
+    """Shared chat completions client.
+
+    Holds one pooled keep-alive connection pool (sync and async) to the
+    backend, applies a per-call deadline that covers every retry, and retries
+    transient failures with jittered exponential backoff.
+    """
+
+    def __init__(
+        self,
+        base_url: str = LLM_BASE_URL,
+        api_key: str = grok_key,
+        model: str = LLM_MODEL,
+        timeout: float = LLM_TIMEOUT,
+        max_retries: int = LLM_MAX_RETRIES,
+        max_connections: int = LLM_MAX_CONNECTIONS,
+        backoff_base: float = 0.25,
+        backoff_max: float = 4.0,
+        cache: ResponseCache = None,
+        admission: AdmissionController = None,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.api_key = api_key
+        self.model = model
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_connections,
+        )
+        self._client = None
+        self._async_client = None
+        # Running totals from the backend's "usage" blocks
+        self.usage = {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0}
+        self._usage_lock = threading.Lock()
+        self.cache = cache if cache is not None else ResponseCache()
+        self.admission = admission if admission is not None else AdmissionController()
+
+    @property
+    def url(self) -> str:
+        return f"{self.base_url}/chat/completions"
+
+    @property
+    def headers(self) -> dict:
+        return {"Authorization": f"Bearer {self.api_key}"} if self.api_key else {}
+
+    @property
+    def client(self) -> httpx.Client:
+        if self._client is None:
+            self._client = httpx.Client(limits=self.limits, headers=self.headers)
+        return self._client
+
+    @property
+    def async_client(self) -> httpx.AsyncClient:
+        if self._async_client is None:
+            self._async_client = httpx.AsyncClient(limits=self.limits, headers=self.headers)
+        return self._async_client
+
+    def payload(self, prompt: str, **options) -> dict:
+        payload = {
+            "model": options.pop("model", None) or self.model,
+            "messages": [{"role": "user", "content": prompt}],
+        }
+        payload.update(options)
+        return payload
+
+    def _backoff(self, attempt: int) -> float:
+        # Full jitter keeps concurrent retries from arriving in lockstep
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def _should_retry(self, attempt: int, deadline: float, delay: float) -> bool:
+        return attempt < self.max_retries and time.monotonic() + delay < deadline
+
+    def _retry_delay(self, attempt: int, response: Optional[httpx.Response], epoch: int = None) -> float:
+        """Backoff before the next attempt; a 429 also shrinks the concurrency cap"""
+        delay = self._backoff(attempt)
+        if response is not None and response.status_code == 429:
+            self.admission.on_throttled(epoch)
+            delay = max(delay, _retry_after(response) or 0.0)
+        return delay
+
+    def _record_usage(self, usage: dict, purpose: str):
+        with self._usage_lock:
+            self.usage["calls"] += 1
+            if usage:
+                self.usage["prompt_tokens"] += usage.get("prompt_tokens") or 0
+                self.usage["completion_tokens"] += usage.get("completion_tokens") or 0
+        if usage:
+            metrics.llm_tokens_total.inc(usage.get("prompt_tokens") or 0, purpose=purpose, kind="prompt")
+            metrics.llm_tokens_total.inc(usage.get("completion_tokens") or 0, purpose=purpose, kind="completion")
+
+    def _content(self, response: httpx.Response, purpose: str) -> str:
+        body = response.json()
+        self._record_usage(body.get("usage"), purpose)
+        return body["choices"][0]["message"]["content"]
+
+    @staticmethod
+    def _observe(purpose: str, outcome: str, start: float):
+        seconds = time.perf_counter() - start
+        metrics.llm_request_seconds.observe(seconds, purpose=purpose, outcome=outcome)
+        metrics.llm_requests_total.inc(purpose=purpose, outcome=outcome)
+        metrics.add_timing(f"llm_{purpose}", seconds)
+
+    def _cache_key(self, payload: dict, cache_template: str, cache_input: str) -> str:
+        options = {k: v for k, v in payload.items() if k not in ("model", "messages")}
+        return self.cache.key(payload["model"], cache_template, cache_input, options)
+
+    def complete(
+        self,
+        prompt: str,
+        timeout: float = None,
+        cache_template: str = None,
+        cache_input: str = None,
+        cache_if: Callable[[str], bool] = None,
+        purpose: str = "other",
+        user: str = "",
+        **options,
+    ) -> str:
+        """Blocking completion.
+
+        Passing cache_template opts the call into the response cache; only do
+        that for prompts whose answer is determined by cache_input (the prompt
+        itself when not given), never for the user-facing chat answer.
+        cache_if can reject replies that shouldn't be kept, e.g. malformed JSON.
+        purpose tags the call's metrics (naming, extraction, conflict, answer...)
+        and picks its admission priority; user is the fairness key among
+        callers waiting in the same priority class.
+        """
+        deadline = time.monotonic() + (timeout or self.timeout)
+        payload = self.payload(prompt, **options)
+        key = None
+        if cache_template:
+            key = self._cache_key(payload, cache_template, prompt if cache_input is None else cache_input)
+            cached = self.cache.get(key)
+            if cached is not None:
+                metrics.llm_requests_total.inc(purpose=purpose, outcome="cached")
+                return cached
+        start = time.perf_counter()
+        try:
+            content = self._complete(payload, deadline, purpose, user)
+        except Exception:
+            self._observe(purpose, "error", start)
+            raise
+        self._observe(purpose, "ok", start)
+        if key is not None and (cache_if is None or cache_if(content)):
+            self.cache.put(key, content)
+        return content
+
+    def _complete(self, payload: dict, deadline: float, purpose: str, user: str) -> str:
+        priority = PURPOSE_PRIORITY.get(purpose, PRIORITY_NORMAL)
+        attempt = 0
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise LLMError("LLM call exceeded its deadline")
+            # The slot is held per attempt, so nothing sits on one while backing off
+            epoch = self.admission.acquire(priority, user, remaining)
+            response = None
+            try:
+                response = self.client.post(self.url, json=payload, timeout=deadline - time.monotonic())
+                if response.status_code not in RETRY_STATUS_CODES:
+                    response.raise_for_status()
+                    self.admission.on_success()
+                    return self._content(response, purpose)
+                error = LLMError(f"LLM backend returned {response.status_code}")
+            except httpx.TransportError as e:
+                error = LLMError(f"LLM request failed: {e}")
+            except httpx.HTTPStatusError as e:
+                raise LLMError(f"LLM backend returned {e.response.status_code}") from e
+            finally:
+                self.admission.release()
+            delay = self._retry_delay(attempt, response, epoch)
+            if not self._should_retry(attempt, deadline, delay):
+                raise error
+            time.sleep(delay)
+            attempt += 1
+
+    async def acomplete(
+        self,
+        prompt: str,
+        timeout: float = None,
+        cache_template: str = None,
+        cache_input: str = None,
+        cache_if: Callable[[str], bool] = None,
+        purpose: str = "other",
+        user: str = "",
+        **options,
+    ) -> str:
+        deadline = time.monotonic() + (timeout or self.timeout)
+        payload = self.payload(prompt, **options)
+        key = None
+        if cache_template:
+            key = self._cache_key(payload, cache_template, prompt if cache_input is None else cache_input)
+            cached = await self.cache.aget(key)
+            if cached is not None:
+                metrics.llm_requests_total.inc(purpose=purpose, outcome="cached")
+                return cached
+        start = time.perf_counter()
+        try:
+            content = await self._acomplete(payload, deadline, purpose, user)
+        except Exception:
+            self._observe(purpose, "error", start)
+            raise
+        self._observe(purpose, "ok", start)
+        if key is not None and (cache_if is None or cache_if(content)):
+            await self.cache.aput(key, content)
+        return content
+
+    async def _acomplete(self, payload: dict, deadline: float, purpose: str, user: str) -> str:
+        priority = PURPOSE_PRIORITY.get(purpose, PRIORITY_NORMAL)
+        attempt = 0
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise LLMError("LLM call exceeded its deadline")
+            epoch = await self.admission.aacquire(priority, user, remaining)
+            response = None
+            try:
+                response = await self.async_client.post(self.url, json=payload, timeout=deadline - time.monotonic())
+                if response.status_code not in RETRY_STATUS_CODES:
+                    response.raise_for_status()
+                    self.admission.on_success()
+                    return self._content(response, purpose)
+                error = LLMError(f"LLM backend returned {response.status_code}")
+            except httpx.TransportError as e:
+                error = LLMError(f"LLM request failed: {e}")
+            except httpx.HTTPStatusError as e:
+                raise LLMError(f"LLM backend returned {e.response.status_code}") from e
+            finally:
+                self.admission.release()
+            delay = self._retry_delay(attempt, response, epoch)
+            if not self._should_retry(attempt, deadline, delay):
+                raise error
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def astream(self, prompt: str, timeout: float = None, purpose: str = "other", user: str = "", **options):
+        """Yield completion tokens as the backend streams them.
+
+        Connection failures are retried only until the first token arrives;
+        after that the stream can't be replayed without duplicating output.
+        """
+        start = time.perf_counter()
+        try:
+            async for token in self._astream(prompt, timeout, purpose, user, **options):
+                yield token
+        except Exception:
+            self._observe(purpose, "error", start)
+            raise
+        self._observe(purpose, "ok", start)
+
+    async def _astream(self, prompt: str, timeout: float, purpose: str, user: str, **options):
+        deadline = time.monotonic() + (timeout or self.timeout)
+        payload = self.payload(prompt, stream=True, **options)
+        priority = PURPOSE_PRIORITY.get(purpose, PRIORITY_NORMAL)
+        attempt = 0
+        started = False
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise LLMError("LLM call exceeded its deadline")
+            # Held until the stream ends: the backend is busy for all of it
+            epoch = await self.admission.aacquire(priority, user, remaining)
+            throttled = None
+            try:
+                async with self.async_client.stream(
+                    "POST", self.url, json=payload, timeout=deadline - time.monotonic()
+                ) as response:
+                    if response.status_code in RETRY_STATUS_CODES:
+                        error = LLMError(f"LLM backend returned {response.status_code}")
+                        throttled = response
+                    else:
+                        if response.status_code >= 400:
+                            raise LLMError(f"LLM backend returned {response.status_code}")
+                        async for line in response.aiter_lines():
+                            if not line.startswith("data:"):
+                                continue
+                            data = line[len("data:"):].strip()
+                            if data == "[DONE]":
+                                self.admission.on_success()
+                                return
+                            choices = json.loads(data).get("choices") or [{}]
+                            token = choices[0].get("delta", {}).get("content")
+                            if token:
+                                started = True
+                                yield token
+                        self.admission.on_success()
+                        return
+            except httpx.TransportError as e:
+                if started:
+                    raise LLMError(f"LLM stream interrupted: {e}") from e
+                error = LLMError(f"LLM request failed: {e}")
+            finally:
+                self.admission.release()
+            delay = self._retry_delay(attempt, throttled, epoch)
+            if not self._should_retry(attempt, deadline, delay):
+                raise error
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def prime(self, timeout: float = 5):
+        """Open pooled connections (TCP and TLS) to the backend ahead of the first call.
+
+        Any HTTP response will do, so the status is ignored; only a transport
+        failure is reported.
+        """
+        await asyncio.to_thread(self.client.get, f"{self.base_url}/models", timeout=timeout)
+        await self.async_client.get(f"{self.base_url}/models", timeout=timeout)
+
+    def close(self):
+        if self._client is not None:
+            self._client.close()
+            self._client = None
+
+    async def aclose(self):
+        self.close()
+        if self._async_client is not None:
+            await self._async_client.aclose()
+            self._async_client = None
+
+
+client = LLMClient()
+
+
+def configure(**kwargs) -> LLMClient:
+    """Swap the shared client, e.g. to point it at a local stub backend"""
+    global client
+    client.close()
+    client = LLMClient(**kwargs)
+    return client
+
+
+# Calls without a username are queued fairly per session instead
+def ask_llm(prompt: str, session_id: str, timeout: float = None, user: str = None, **options) -> str:
+    return client.complete(prompt, timeout=timeout, user=user or session_id, **options)
+
+
+async def ask_llm_async(prompt: str, session_id: str, timeout: float = None, user: str = None, **options) -> str:
+    return await client.acomplete(prompt, timeout=timeout, user=user or session_id, **options)
+
+
+def stream_llm(prompt: str, session_id: str, timeout: float = None, user: str = None, **options):
+    return client.astream(prompt, timeout=timeout, user=user or session_id, **options)
+
+
+SESSION_NAME_TEMPLATE = "session_name-v1"
+
+
+def _session_name_prompt(first_message: str) -> str:
+    return f"""Generate a very short (2-5 words) title for a chat conversation that starts with this message: "{first_message}"
 
 Rules:
 - Maximum 5 words
@@ -35,27 +774,46 @@ Examples:
 - "I need coding help" -> "Coding Assistance"
 
 Title:"""
-        
-        payload = {
-            "model": "x-ai/grok-4-fast",
-            "messages": [{"role": "user", "content": prompt}],
-            "max_tokens": 20
-        }
-        headers = {"Authorization": f"Bearer {api_key}"}
-        response = requests.post(url, json=payload, headers=headers, timeout=5)
-        
-        if response.status_code == 200:
-            title = response.json()["choices"][0]["message"]["content"].strip()
-            # Clean up the title
-            title = title.replace('"', '').replace("'", '').strip()
-            # Limit to 50 characters
-            if len(title) > 50:
-                title = title[:47] + "..."
-            return title if title else "New Chat"
-        else:
-            return "New Chat"
+
+
+def _session_name_options(first_message: str) -> dict:
+    return {
+        "timeout": 5,
+        "max_tokens": 20,
+        # "Hi" and "hi  " get the same title
+        "cache_template": SESSION_NAME_TEMPLATE,
+        "cache_input": first_message.casefold(),
+        "purpose": "naming",
+    }
+
+
+def _clean_title(title: str) -> str:
+    title = title.strip().replace('"', '').replace("'", '').strip()
+    # Limit to 50 characters
+    if len(title) > 50:
+        title = title[:47] + "..."
+    return title if title else "New Chat"
+
+
+def _fallback_name(first_message: str, error: Exception) -> str:
+    logger.warning("Error generating session name: %s", error)
+    # Fallback: use first few words of the message
+    words = first_message.split()[:4]
+    return " ".join(words).capitalize() if words else "New Chat"
+
+
+def generate_session_name(first_message: str, user: str = "") -> str:
+    """Generate a short, descriptive session name based on the first message"""
+    try:
+        title = client.complete(_session_name_prompt(first_message), user=user, **_session_name_options(first_message))
+    except Exception as e:
+        return _fallback_name(first_message, e)
+    return _clean_title(title)
+
+
+async def generate_session_name_async(first_message: str, user: str = "") -> str:
+    try:
+        title = await client.acomplete(_session_name_prompt(first_message), user=user, **_session_name_options(first_message))
     except Exception as e:
-        print(f"Error generating session name: {e}")
-        # Fallback: use first few words of the message
-        words = first_message.split()[:4]
-        return " ".join(words).capitalize() if words else "New Chat"
\ No newline at end of file
+        return _fallback_name(first_message, e)
+    return _clean_title(title)
@@ -0,0 +1,99 @@
+import json
+import logging
+import os
+from typing import Dict
+
+from pydantic import ValidationError
+
+from app.prompts import memory_prompt
+from app.schemas.memory import MemoryUpdate
+from app.services import llm
+from app.services.extract_facts import extract_facts
+from app.services.conflict_detect_update import (
+    ConflictResult,
+    conflict_check,
+    find_conflict_candidates,
+    find_relevant_facts,
+    format_stored_facts,
+    update_memory,
+)
+from app.utils import user_info_check
+
+logger = logging.getLogger(__name__)
+
+# two_call: extract facts, then check them for conflicts (two LLM calls)
+# single_pass: one structured call does both against the relevant stored facts
+MEMORY_MODE = os.getenv("MEMORY_MODE", "two_call")
+MEMORY_MODES = ("two_call", "single_pass")
+SINGLE_PASS_CACHE_TEMPLATE = llm.template_id("memory_update", memory_prompt.PROMPT)
+
+
+def two_call_update(username: str, messages: str, session_id: str) -> Dict[str, any]:
+    new_facts = extract_facts(messages, session_id, username)
+    if not new_facts:
+        return {"status": "success", "action": "none", "facts_count": 0, "message": "No new facts"}
+    # Only stored facts close to the new ones can conflict with them
+    candidates = find_conflict_candidates(username, new_facts, user_info_check.get_user_facts(username))
+    conflict_result = conflict_check(new_facts, candidates, session_id, username)
+    return update_memory(
+        username=username,
+        extracted_facts=new_facts,
+        conflict_result=conflict_result,
+    )
+
+
+def single_pass_update(username: str, messages: str, session_id: str) -> Dict[str, any]:
+    """Extract facts and resolve conflicts in one structured LLM call.
+
+    The stored facts are retrieved against the raw message instead of the
+    extracted facts, so the model sees them up front and reports new facts and
+    superseded fact ids together. Raises LLMError, ValueError or
+    ValidationError when the call or its output is unusable.
+    """
+    candidates = find_relevant_facts(username, messages, user_info_check.get_user_facts(username))
+    stored_facts = format_stored_facts(candidates) or "(none)"
+    prompt = memory_prompt.PROMPT.format(user_message=messages, stored_facts=stored_facts)
+    response = llm.ask_llm(
+        prompt,
+        session_id,
+        response_format=memory_prompt.RESPONSE_FORMAT,
+        cache_template=SINGLE_PASS_CACHE_TEMPLATE,
+        cache_input=f"{messages}\n---\n{stored_facts}",
+        cache_if=llm.is_json,
+        purpose="memory_update",
+        user=username,
+    )
+    update = MemoryUpdate.model_validate(json.loads(response))
+    if not update.new_facts:
+        return {"status": "success", "action": "none", "facts_count": 0, "message": "No new facts"}
+
+    # Same guard as the two-call parser: only offered ids may be superseded
+    candidate_ids = {fact['id'] for fact in candidates}
+    supersessions = {
+        entry.fact_id: entry.replaced_by - 1 if entry.replaced_by else None
+        for entry in update.superseded
+        if entry.fact_id in candidate_ids
+    }
+    conflict_result = ConflictResult(
+        has_conflict=bool(supersessions),
+        conflicting_facts=[str(fact_id) for fact_id in supersessions],
+        raw_response=response,
+        supersessions=supersessions,
+    )
+    return update_memory(
+        username=username,
+        extracted_facts=[fact.model_dump() for fact in update.new_facts],
+        conflict_result=conflict_result,
+    )
+
+
+def update_user_memory(username: str, messages: str, session_id: str, mode: str = MEMORY_MODE) -> Dict[str, any]:
+    if mode not in MEMORY_MODES:
+        raise ValueError(f"Unknown memory mode: {mode}")
+    if mode == "single_pass":
+        try:
+            return single_pass_update(username, messages, session_id)
+        except (llm.LLMError, ValueError, ValidationError) as e:
+            # Backends without structured output, or a malformed reply: fall back
+            logger.warning("Single-pass memory update failed, falling back to two calls: %s", e)
+    return two_call_update(username, messages, session_id)
@@ -0,0 +1,198 @@
+import asyncio
+import logging
+import os
+import time
+import uuid
+import zlib
+from dataclasses import dataclass, field
+from typing import Dict, List
+
+from app.services import lexical_index
+from app.services.memory_pipeline import update_user_memory
+from app.services.summary import summarize_session
+from app.services.vector_store import add_message_embeddings
+from app.utils.embeddings import get_embeddings
+from app.utils.metrics import span
+
+MEMORY_WORKERS = int(os.getenv("MEMORY_WORKERS", "2"))
+MEMORY_BATCH_SIZE = int(os.getenv("MEMORY_BATCH_SIZE", "16"))
+MEMORY_BATCH_WAIT_MS = float(os.getenv("MEMORY_BATCH_WAIT_MS", "50"))
+MEMORY_QUEUE_SIZE = int(os.getenv("MEMORY_QUEUE_SIZE", "1000"))
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class MemoryJob:
+    username: str
+    session_id: str
+    message: str
+    response: str
+    enqueued_at: float = field(default_factory=time.monotonic)
+
+
+class MemoryWorker:
+    """In-process memory ingestion for finished chat turns.
+
+    Fact extraction, conflict resolution and interaction embeddings aren't
+    needed to answer the current turn, so the chat handler hands turns to this
+    worker and returns. Jobs are partitioned by username so one user's facts
+    are always updated by the same worker, in order; each worker drains up to
+    MEMORY_BATCH_SIZE jobs at a time and extracts facts once per user per batch.
+    Sessions touched by a batch then get their rolling summaries brought up to
+    date.
+    """
+
+    def __init__(
+        self,
+        workers: int = MEMORY_WORKERS,
+        batch_size: int = MEMORY_BATCH_SIZE,
+        batch_wait_ms: float = MEMORY_BATCH_WAIT_MS,
+        queue_size: int = MEMORY_QUEUE_SIZE,
+    ):
+        self.workers = max(1, workers)
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait_ms / 1000
+        self.queue_size = queue_size
+        self.queues: List[asyncio.Queue] = []
+        self.tasks: List[asyncio.Task] = []
+        self.closing = False
+        self.processed = 0
+        self.failed = 0
+        self.batches = 0
+        self.summaries = 0
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+
+    @property
+    def running(self) -> bool:
+        return bool(self.tasks)
+
+    def start(self):
+        if self.running:
+            return
+        self.queues = [asyncio.Queue(maxsize=self.queue_size) for _ in range(self.workers)]
+        self.tasks = [asyncio.create_task(self._run(queue)) for queue in self.queues]
+
+    async def stop(self, timeout: float = 30):
+        """Stop accepting work and drain what is already queued"""
+        if not self.running:
+            return
+        self.closing = True
+        try:
+            await asyncio.wait_for(asyncio.gather(*(queue.join() for queue in self.queues)), timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Memory worker drain timed out with %d job(s) pending", self.depth)
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+        self.queues = []
+        self.closing = False
+
+    async def submit(self, job: MemoryJob):
+        if self.closing:
+            # Shutting down: ingest inline rather than losing the turn
+            await asyncio.to_thread(self.process_batch, [job])
+            return
+        if not self.running:
+            self.start()
+        # Blocks when the queue is full, which pushes back on the chat handlers
+        await self.queues[zlib.crc32(job.username.encode()) % self.workers].put(job)
+
+    @property
+    def depth(self) -> int:
+        return sum(queue.qsize() for queue in self.queues)
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "running": self.running,
+            "workers": self.workers,
+            "queue_depth": self.depth,
+            "processed": self.processed,
+            "failed": self.failed,
+            "batches": self.batches,
+            "summaries": self.summaries,
+            "last_lag_seconds": round(self.last_lag, 3),
+            "max_lag_seconds": round(self.max_lag, 3),
+        }
+
+    async def _next_batch(self, queue: asyncio.Queue) -> List[MemoryJob]:
+        batch = [await queue.get()]
+        deadline = time.monotonic() + self.batch_wait
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self, queue: asyncio.Queue):
+        while True:
+            batch = await self._next_batch(queue)
+            lag = time.monotonic() - batch[0].enqueued_at
+            self.last_lag = lag
+            self.max_lag = max(self.max_lag, lag)
+            try:
+                await asyncio.to_thread(self.process_batch, batch)
+            except Exception:
+                logger.exception("Memory batch failed")
+            finally:
+                self.batches += 1
+                for _ in batch:
+                    queue.task_done()
+
+    def process_batch(self, batch: List[MemoryJob]):
+        try:
+            with span("memory_index"):
+                self._index_interactions(batch)
+        except Exception:
+            logger.exception("Failed to index interactions")
+
+        by_user: Dict[str, List[MemoryJob]] = {}
+        for job in batch:
+            by_user.setdefault(job.username, []).append(job)
+        for username, jobs in by_user.items():
+            try:
+                with span("memory_facts"):
+                    result = self._update_facts(username, jobs)
+                # Storing the facts reports its failures as an error result rather than raising
+                if result.get("status") == "error":
+                    self.failed += len(jobs)
+                    logger.error("Failed to store facts for %s: %s", username, result.get("message"))
+                else:
+                    self.processed += len(jobs)
+            except Exception:
+                self.failed += len(jobs)
+                logger.exception("Failed to update memory for %s", username)
+
+        # Summary calls are queued fairly per user, like the rest of the memory work
+        for session_id, username in {job.session_id: job.username for job in batch}.items():
+            try:
+                with span("memory_summary"):
+                    summarized = summarize_session(session_id, username=username)
+                if summarized:
+                    self.summaries += 1
+            except Exception:
+                logger.exception("Failed to summarize session %s", session_id)
+
+    def _index_interactions(self, batch: List[MemoryJob]):
+        # One batched encode and one vector store write for the whole batch
+        interaction_texts = [f"{job.message}\n{job.response}" for job in batch]
+        usernames = [job.username for job in batch]
+        session_ids = [job.session_id for job in batch]
+        doc_ids = [f"{job.username}-{job.session_id}-{uuid.uuid4()}" for job in batch]
+        # Keyword index first: it is cheap and doesn't wait on the model
+        lexical_index.add_interactions(interaction_texts, usernames, session_ids, doc_ids)
+        add_message_embeddings(interaction_texts, get_embeddings(interaction_texts), usernames, session_ids, doc_ids)
+
+    def _update_facts(self, username: str, jobs: List[MemoryJob]) -> dict:
+        # One memory update covers every turn this user sent in the batch
+        messages = "\n".join(job.message for job in jobs)
+        return update_user_memory(username, messages, jobs[-1].session_id)
+
+
+memory_worker = MemoryWorker()
@@ -0,0 +1,90 @@
+import asyncio
+import inspect
+import logging
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List
+
+from app.utils.metrics import span
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Stage:
+    name: str
+    func: Callable[..., Any]
+    deps: List[str] = field(default_factory=list)
+    optional: bool = False  # a failing optional stage yields None instead of failing the run
+
+
+class Pipeline:
+    """Small dependency graph of request stages.
+
+    Every stage starts as soon as the stages it depends on have finished, so
+    independent stages run concurrently and the run takes roughly as long as
+    the longest path through the graph. Sync functions are run in a worker
+    thread, coroutine functions are awaited directly. Each stage receives the
+    results of its dependencies as keyword arguments named after them. Each
+    stage is timed as a metrics span named after it.
+    """
+
+    def __init__(self):
+        self.stages: Dict[str, Stage] = {}
+        self.tasks: Dict[str, asyncio.Task] = {}
+
+    def add(self, name: str, func: Callable[..., Any], deps: List[str] = None, optional: bool = False):
+        deps = list(deps or [])
+        if name in self.stages:
+            raise ValueError(f"Duplicate stage: {name}")
+        # Dependencies must already be registered, which keeps the graph acyclic
+        for dep in deps:
+            if dep not in self.stages:
+                raise ValueError(f"Stage {name} depends on unknown stage {dep}")
+        self.stages[name] = Stage(name=name, func=func, deps=deps, optional=optional)
+        return self
+
+    async def _run_stage(self, stage: Stage, tasks: Dict[str, asyncio.Task]):
+        kwargs = {}
+        for dep in stage.deps:
+            kwargs[dep] = await tasks[dep]
+        try:
+            with span(stage.name):
+                if inspect.iscoroutinefunction(stage.func):
+                    return await stage.func(**kwargs)
+                return await asyncio.to_thread(stage.func, **kwargs)
+        except Exception as e:
+            if stage.optional:
+                logger.warning("Optional stage %s failed: %s", stage.name, e)
+                return None
+            raise
+
+    def start(self) -> Dict[str, asyncio.Task]:
+        """Schedule every stage without waiting for them"""
+        self.tasks = {}
+        for name, stage in self.stages.items():
+            self.tasks[name] = asyncio.create_task(self._run_stage(stage, self.tasks))
+        return self.tasks
+
+    async def result(self, name: str) -> Any:
+        """Wait for a single stage of a started pipeline"""
+        try:
+            return await self.tasks[name]
+        except Exception:
+            self.cancel()
+            raise
+
+    async def wait(self) -> Dict[str, Any]:
+        try:
+            await asyncio.gather(*self.tasks.values())
+        except Exception:
+            self.cancel()
+            raise
+        return {name: task.result() for name, task in self.tasks.items()}
+
+    def cancel(self):
+        for task in self.tasks.values():
+            task.cancel()
+
+    async def run(self) -> Dict[str, Any]:
+        self.start()
+        return await self.wait()
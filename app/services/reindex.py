@@ -0,0 +1,183 @@
+"""Rebuild vector memory and the keyword index from the chat messages stored in SQLite.
+
+    python -m app.services.reindex [--rebuild] [--lexical-only] [--chunk-size 500] [--batch-size 256]
+
+Sessions are streamed from the database in id order, user/assistant turns are
+paired into interaction texts the same way the chat handler builds them, and
+the texts are embedded in large batches and upserted into each user's vector
+partition. Progress is checkpointed after every chunk, so an interrupted run
+picks up where it stopped when started again with the same checkpoint file.
+--lexical-only fills just the keyword index, without loading the model, e.g.
+to index history written before the keyword index existed.
+"""
+import argparse
+import json
+import os
+import time
+
+from sqlmodel import Session as DBSession, select
+
+from app.models.database import ChatMessage, SessionData, User, engine
+from app.models.migrations import run_migrations
+from app.services import lexical_index
+from app.services.vector_store import add_message_embeddings, drop_all_collections
+from app.utils.embeddings import encode
+
+DEFAULT_CHECKPOINT = os.path.join(
+    os.path.dirname(os.getenv("DATABASE_PATH", "/app/data/mydb.sqlite")), "reindex_checkpoint.json"
+)
+LEXICAL_CHECKPOINT = os.path.join(os.path.dirname(DEFAULT_CHECKPOINT), "reindex_lexical_checkpoint.json")
+
+
+def interaction_pairs(chat_history: list) -> list:
+    """Pair each user message with the assistant reply that follows it"""
+    pairs = []
+    pending = None
+    for msg in chat_history:
+        if not isinstance(msg, dict):
+            continue
+        if msg.get("role") == "user":
+            pending = msg.get("content") or ""
+        elif msg.get("role") == "assistant" and pending is not None:
+            pairs.append(f"{pending}\n{msg.get('content') or ''}")
+            pending = None
+    return pairs
+
+
+def reindex_id(username: str, session_id: str, turn: int) -> str:
+    # Same "{username}-{session_id}-..." shape as live ids, but deterministic so reruns upsert
+    return f"{username}-{session_id}-reindex-{turn}"
+
+
+def load_checkpoint(path: str) -> dict:
+    if path and os.path.exists(path):
+        with open(path) as f:
+            return json.load(f)
+    return {"last_row_id": 0, "sessions": 0, "embeddings": 0}
+
+
+def save_checkpoint(path: str, checkpoint: dict):
+    if not path:
+        return
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(checkpoint, f)
+    os.replace(tmp_path, path)
+
+
+def iter_session_chunks(last_row_id: int, chunk_size: int):
+    """Yield chunks of (row_id, username, session_id, messages), resuming after last_row_id"""
+    while True:
+        with DBSession(engine) as db:
+            sessions = db.exec(
+                select(SessionData.id, User.username, SessionData.session_id)
+                .join(User, User.id == SessionData.user_id)
+                .where(SessionData.id > last_row_id)
+                .order_by(SessionData.id)
+                .limit(chunk_size)
+            ).all()
+            if not sessions:
+                return
+            # One ranged read over the (session_id, seq) index for the whole chunk
+            messages = db.exec(
+                select(ChatMessage)
+                .where(ChatMessage.session_id.in_([session_id for _, _, session_id in sessions]))
+                .order_by(ChatMessage.session_id, ChatMessage.seq)
+            ).all()
+        by_session = {}
+        for msg in messages:
+            by_session.setdefault(msg.session_id, []).append({"role": msg.role, "content": msg.content})
+        yield [(row_id, username, session_id, by_session.get(session_id, [])) for row_id, username, session_id in sessions]
+        last_row_id = sessions[-1][0]
+
+
+def flush(batch: dict, lexical_only: bool = False) -> int:
+    if not batch["texts"]:
+        return 0
+    lexical_index.add_interactions(batch["texts"], batch["usernames"], batch["session_ids"], batch["ids"], upsert=True)
+    if not lexical_only:
+        embeddings = encode(batch["texts"])
+        add_message_embeddings(
+            batch["texts"], embeddings, batch["usernames"], batch["session_ids"], batch["ids"], upsert=True
+        )
+    count = len(batch["texts"])
+    for rows in batch.values():
+        rows.clear()
+    return count
+
+
+def reindex(
+    chunk_size: int = 500,
+    batch_size: int = 256,
+    checkpoint_path: str = DEFAULT_CHECKPOINT,
+    rebuild: bool = False,
+    lexical_only: bool = False,
+) -> dict:
+    run_migrations()
+    checkpoint = load_checkpoint(checkpoint_path)
+    if rebuild and checkpoint["last_row_id"] == 0:
+        # Only on a fresh run; a resumed rebuild must keep what it already wrote
+        lexical_index.clear()
+        if not lexical_only:
+            drop_all_collections()
+
+    start = time.perf_counter()
+    sessions = embedded = 0
+    embedded_before = checkpoint["embeddings"]
+    batch = {"texts": [], "usernames": [], "session_ids": [], "ids": []}
+
+    for rows in iter_session_chunks(checkpoint["last_row_id"], chunk_size):
+        for _, username, session_id, chat_history in rows:
+            for turn, text in enumerate(interaction_pairs(chat_history)):
+                batch["texts"].append(text)
+                batch["usernames"].append(username)
+                batch["session_ids"].append(session_id)
+                batch["ids"].append(reindex_id(username, session_id, turn))
+                if len(batch["texts"]) >= batch_size:
+                    embedded += flush(batch, lexical_only)
+            sessions += 1
+
+        # Everything up to the end of this chunk is written before it is checkpointed
+        embedded += flush(batch, lexical_only)
+        checkpoint["last_row_id"] = rows[-1][0]
+        checkpoint["sessions"] += len(rows)
+        checkpoint["embeddings"] = embedded_before + embedded
+        save_checkpoint(checkpoint_path, checkpoint)
+
+        elapsed = time.perf_counter() - start
+        print(
+            f"sessions={sessions} embeddings={embedded} "
+            f"rows/s={sessions / elapsed:.1f} embeddings/s={embedded / elapsed:.1f}"
+        )
+
+    elapsed = time.perf_counter() - start
+    return {
+        "sessions": sessions,
+        "embeddings": embedded,
+        "seconds": round(elapsed, 2),
+        "rows_per_second": round(sessions / elapsed, 1) if elapsed else 0.0,
+        "embeddings_per_second": round(embedded / elapsed, 1) if elapsed else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild vector memory and the keyword index from SQLite chat history")
+    parser.add_argument("--chunk-size", type=int, default=500, help="Sessions read from the database per chunk")
+    parser.add_argument("--batch-size", type=int, default=256, help="Interactions embedded per model call")
+    parser.add_argument("--checkpoint", help="Checkpoint file for resuming")
+    parser.add_argument("--rebuild", action="store_true", help="Drop the existing index(es) before a fresh run")
+    parser.add_argument("--lexical-only", action="store_true", help="Only fill the keyword index; no embeddings")
+    parser.add_argument("--reset", action="store_true", help="Ignore and remove an existing checkpoint")
+    args = parser.parse_args()
+
+    # Separate default checkpoints, so a keyword-only pass doesn't mark a full one done
+    checkpoint = args.checkpoint or (LEXICAL_CHECKPOINT if args.lexical_only else DEFAULT_CHECKPOINT)
+    if args.reset and os.path.exists(checkpoint):
+        os.remove(checkpoint)
+
+    report = reindex(args.chunk_size, args.batch_size, checkpoint, args.rebuild, args.lexical_only)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
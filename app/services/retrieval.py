@@ -0,0 +1,82 @@
+"""User-scoped hybrid retrieval of past interactions for the chat prompt.
+
+Searches every session the user has, not only the current one, with two
+retrievers run side by side: nearest neighbours in the vector store and BM25
+keyword matches in the lexical index. Their rankings are merged with
+reciprocal rank fusion, which needs no score calibration between the two.
+Retrieval stops after RETRIEVAL_BUDGET_MS: whatever has answered by then is
+fused and a late retriever is left out of this turn.
+"""
+import contextvars
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Sequence
+
+from app.services import lexical_index, vector_store
+from app.utils import metrics
+
+logger = logging.getLogger(__name__)
+
+RETRIEVAL_BUDGET_MS = float(os.getenv("RETRIEVAL_BUDGET_MS", "200"))
+# Candidates taken from each retriever before fusion
+RETRIEVAL_CANDIDATES = int(os.getenv("RETRIEVAL_CANDIDATES", "20"))
+RETRIEVAL_WORKERS = int(os.getenv("RETRIEVAL_WORKERS", "8"))
+# Standard RRF constant; damps the weight of the very top ranks
+RRF_K = 60
+
+_executor = ThreadPoolExecutor(max_workers=RETRIEVAL_WORKERS, thread_name_prefix="retrieval")
+
+
+def fuse(rankings: dict, limit: int, k: int = RRF_K) -> list[str]:
+    """Reciprocal rank fusion of ranked document lists, best first.
+
+    Documents are keyed by their text: live and reindexed copies of the same
+    turn carry different ids but should count once.
+    """
+    scores = {}
+    for ranking in rankings.values():
+        for rank, document in enumerate(dict.fromkeys(ranking), start=1):
+            scores[document] = scores.get(document, 0.0) + 1.0 / (k + rank)
+    return sorted(scores, key=scores.get, reverse=True)[:limit]
+
+
+def _dense(username: str, embedding: Sequence[float], candidates: int) -> list[str]:
+    with metrics.span("retrieval_dense"):
+        return [document for _, document, _, _ in vector_store.query_user_messages(embedding, username, candidates)]
+
+
+def _lexical(username: str, query: str, candidates: int) -> list[str]:
+    with metrics.span("retrieval_lexical"):
+        return [content for _, content, _, _ in lexical_index.search(username, query, candidates)]
+
+
+def search(
+    username: str,
+    query: str,
+    embedding: Sequence[float],
+    limit: int = 5,
+    budget_ms: float = RETRIEVAL_BUDGET_MS,
+    candidates: int = RETRIEVAL_CANDIDATES,
+) -> list[str]:
+    """The user's past interactions most relevant to query, from any session"""
+    deadline = time.monotonic() + budget_ms / 1000
+    retrievers = {"dense": (_dense, embedding), "lexical": (_lexical, query)}
+    # Each task runs in a copy of the caller's context, so its spans land in this request's timings
+    futures = {
+        _executor.submit(contextvars.copy_context().run, func, username, argument, candidates): name
+        for name, (func, argument) in retrievers.items()
+    }
+    wait(futures, timeout=max(0.0, deadline - time.monotonic()))
+
+    rankings = {}
+    for future, name in futures.items():
+        if not future.done():
+            metrics.retrieval_timeouts_total.inc(retriever=name)
+            continue
+        try:
+            rankings[name] = future.result()
+        except Exception as e:
+            logger.warning("%s retrieval failed for %s: %s", name, username, e)
+    return fuse(rankings, limit)
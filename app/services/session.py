@@ -1,18 +1,27 @@
-from app.models.database import User,SessionData,engine
+from app.models.database import SessionData,ChatMessage,engine
 from sqlmodel import Session as DBSession,select
+from sqlalchemy import func, update
+from sqlalchemy.exc import IntegrityError
+from app.utils import user_info_check
+from app.services.user_directory import user_directory
 import json
+import os
 import uuid
+from datetime import datetime
+
+# Messages returned by append_chat_interaction for the prompt's recent history
+HISTORY_LIMIT = 10
+# Most messages kept beyond the window while they wait to be folded into the summary
+HISTORY_MAX_UNSUMMARIZED = int(os.getenv("HISTORY_MAX_UNSUMMARIZED", "40"))
 
 
 def create_or_get_session(username: str, session_id: str = None, data: dict = None) -> str:
     data = data or {}
+    # Find user ID
+    user_id = user_directory.get_id(username)
+    if user_id is None:
+        raise ValueError("User not found")
     with DBSession(engine) as db:
-        # Find user ID
-        print([u.username for u in db.exec(select(User)).all()])
-
-        user = db.exec(select(User).where(User.username == username)).first()
-        if not user:
-            raise ValueError("User not found")
         # If session_id is provided, try to reuse
         if session_id:
             session = db.exec(select(SessionData).where(SessionData.session_id == session_id)).first()
@@ -22,7 +31,7 @@ def create_or_get_session(username: str, session_id: str = None, data: dict = No
         new_session_id = str(uuid.uuid4())
         session = SessionData(
             session_id=new_session_id,
-            user_id=user.id,
+            user_id=user_id,
             data=json.dumps(data)
         )
         db.add(session)
@@ -31,61 +40,113 @@ def create_or_get_session(username: str, session_id: str = None, data: dict = No
         return session.session_id
 
     
-def get_session_data(session_id: str):
+def session_version(session_id: str) -> int:
+    """Seq of the newest message, -1 for none: changes whenever the history does"""
     with DBSession(engine) as db:
-        session = db.exec(select(SessionData).where(SessionData.session_id == session_id)).first()
-        if not session:
-            # Return empty chat history for new sessions instead of None
-            return {"messages": []}
-        
-        chat_data = json.loads(session.data) if session.data else []
-        
-        # Ensure it's a list
-        if not isinstance(chat_data, list):
-            chat_data = []
-        
-        # Return in the expected format
-        return {"messages": chat_data}
-
-
-def get_sessions_for_user(username: str):
+        last_seq = db.exec(select(func.max(ChatMessage.seq)).where(ChatMessage.session_id == session_id)).one()
+    return -1 if last_seq is None else last_seq
+
+
+def get_session_data(session_id: str, since: int = None):
+    """Chat history in the expected format; empty for new sessions.
+
+    With since only the messages after that seq are returned. cursor is the
+    value to pass as since on the next call.
+    """
+    with DBSession(engine) as db:
+        query = select(ChatMessage).where(ChatMessage.session_id == session_id)
+        if since is not None:
+            query = query.where(ChatMessage.seq > since)
+        messages = db.exec(query.order_by(ChatMessage.seq)).all()
+    if messages:
+        cursor = messages[-1].seq
+    else:
+        cursor = -1 if since is None else since
+    return {"messages": [_message_dict(msg) for msg in messages], "cursor": cursor}
+
+
+def sessions_version(username: str) -> tuple:
+    """Session count and latest updated_at: changes with any new session, message or rename"""
+    user_id = user_directory.get_id(username)
+    if user_id is None:
+        return (0, None)
     with DBSession(engine) as db:
-        user = db.exec(select(User).where(User.username == username)).first()
-        if not user:
-            return []
-        sessions = db.exec(select(SessionData).where(SessionData.user_id == user.id)).all()
-        return [{"session_id": session.session_id, "session_name": session.session_name or "New Chat"} for session in sessions]
+        return tuple(db.exec(
+            select(func.count(SessionData.id), func.max(SessionData.updated_at)).where(SessionData.user_id == user_id)
+        ).one())
 
 
+def get_sessions_for_user(username: str, limit: int = None, after: int = None) -> dict:
+    """A user's sessions, oldest first.
 
-def append_chat_interaction(session_id: str, role: str, content: str):
+    With a limit the list is paged by keyset: next_cursor is passed back as
+    after to fetch the following page, and is None on the last one.
+    """
+    user_id = user_directory.get_id(username)
+    if user_id is None:
+        return {"sessions": [], "next_cursor": None}
+    query = select(SessionData.id, SessionData.session_id, SessionData.session_name, SessionData.updated_at).where(
+        SessionData.user_id == user_id
+    )
+    if after is not None:
+        query = query.where(SessionData.id > after)
+    query = query.order_by(SessionData.id)
+    if limit is not None:
+        # One extra row tells whether another page follows
+        query = query.limit(limit + 1)
     with DBSession(engine) as db:
-        session = db.exec(select(SessionData).where(SessionData.session_id == session_id)).first()
-        if not session:
+        rows = db.exec(query).all()
+    next_cursor = None
+    if limit is not None and len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = rows[-1].id
+    sessions = [
+        {"session_id": row.session_id, "session_name": row.session_name or "New Chat", "updated_at": row.updated_at}
+        for row in rows
+    ]
+    return {"sessions": sessions, "next_cursor": next_cursor}
+
+
+
+def _message_dict(msg: ChatMessage) -> dict:
+    return {"role": msg.role, "content": msg.content}
+
+
+def append_chat_interaction(session_id: str, role: str, content: str, history_limit: int = HISTORY_LIMIT):
+    """Append one message and return the most recent history_limit messages"""
+    with DBSession(engine) as db:
+        session_exists = db.exec(select(SessionData.id).where(SessionData.session_id == session_id)).first()
+        if not session_exists:
             raise ValueError("Session not found")
-        chat_history = json.loads(session.data) if session.data else []
-        if not isinstance(chat_history, list):
-            chat_history = []
-        chat_history = chat_history[-10:]
-        chat_history.append({"role": role, "content": content})
-        session.data = json.dumps(chat_history)
-        db.add(session)
-        db.commit()
-        db.refresh(session)
-        return chat_history
+        for attempt in range(3):
+            # seq comes from the (session_id, seq) index; a concurrent append of the
+            # same seq trips the unique constraint and is retried with the next one
+            last_seq = db.exec(select(func.max(ChatMessage.seq)).where(ChatMessage.session_id == session_id)).one()
+            db.add(ChatMessage(
+                session_id=session_id,
+                seq=0 if last_seq is None else last_seq + 1,
+                role=role,
+                content=content,
+            ))
+            db.exec(update(SessionData).where(SessionData.session_id == session_id).values(updated_at=datetime.now()))
+            try:
+                db.commit()
+                break
+            except IntegrityError:
+                db.rollback()
+                if attempt == 2:
+                    raise
+    return get_chat_history(session_id, limit=history_limit)
 
 def is_first_message(session_id: str) -> bool:
     """Check if this is the first user message in the session"""
     with DBSession(engine) as db:
-        session = db.exec(select(SessionData).where(SessionData.session_id == session_id)).first()
-        if not session:
-            return True
-        chat_history = json.loads(session.data) if session.data else []
-        if not isinstance(chat_history, list):
-            return True
-        # Check if there are any user messages
-        user_messages = [msg for msg in chat_history if msg.get('role') == 'user']
-        return len(user_messages) == 0
+        user_message = db.exec(
+            select(ChatMessage.id)
+            .where(ChatMessage.session_id == session_id, ChatMessage.role == "user")
+            .limit(1)
+        ).first()
+        return user_message is None
 
 def update_session_name(session_id: str, name: str):
     """Update the session name"""
@@ -93,17 +154,110 @@ def update_session_name(session_id: str, name: str):
         session = db.exec(select(SessionData).where(SessionData.session_id == session_id)).first()
         if session:
             session.session_name = name
+            session.updated_at = datetime.now()
             db.add(session)
             db.commit()
             db.refresh(session)
 
-def get_chat_history(session_id: str) -> list:
-    """Get chat history for a session without adding new messages"""
+def get_chat_history(session_id: str, limit: int = None) -> list:
+    """Get chat history for a session without adding new messages.
+
+    With a limit only the last `limit` messages are read, oldest first.
+    """
     with DBSession(engine) as db:
-        session = db.exec(select(SessionData).where(SessionData.session_id == session_id)).first()
-        if not session:
-            return []
-        chat_history = json.loads(session.data) if session.data else []
-        if not isinstance(chat_history, list):
-            return []
-        return chat_history
+        query = select(ChatMessage).where(ChatMessage.session_id == session_id)
+        if limit is None:
+            messages = db.exec(query.order_by(ChatMessage.seq)).all()
+        else:
+            messages = list(reversed(db.exec(query.order_by(ChatMessage.seq.desc()).limit(limit)).all()))
+        return [_message_dict(msg) for msg in messages]
+
+
+class ChatContext:
+    """Request-scoped unit of work for one chat turn.
+
+    load() reads the session row, its recent history and the user's facts in a
+    single database session. Messages and renames made during the request are
+    buffered in memory and written by flush() in one transaction, instead of
+    every helper above opening its own session and committing.
+    """
+
+    def __init__(self, session_id: str, username: str, history: list, facts: list, last_seq: int, history_limit: int = HISTORY_LIMIT, summary: str = None):
+        self.session_id = session_id
+        self.username = username
+        self.history = history
+        self.facts = facts
+        # Rolling summary of the turns before the history window, kept by the memory worker
+        self.summary = summary
+        self.last_seq = last_seq
+        self.history_limit = history_limit
+        self.pending_messages = []
+        self.pending_name = None
+        # Turns alternate user/assistant, so a window of two or more messages holds
+        # a user message unless the session has none yet
+        self.is_first_message = not any(msg["role"] == "user" for msg in history)
+
+    @classmethod
+    def load(cls, session_id: str, username: str, history_limit: int = HISTORY_LIMIT) -> "ChatContext":
+        with DBSession(engine) as db:
+            session_row = db.exec(
+                select(SessionData.id, SessionData.summary, SessionData.summary_seq).where(SessionData.session_id == session_id)
+            ).first()
+            if not session_row:
+                raise ValueError("Session not found")
+            recent = db.exec(
+                select(ChatMessage)
+                .where(ChatMessage.session_id == session_id)
+                .order_by(ChatMessage.seq.desc())
+                .limit(history_limit + HISTORY_MAX_UNSUMMARIZED)
+            ).all()
+            facts = user_info_check.get_user_facts(username, db=db)
+        # Messages that have left the window but aren't in the summary yet stay
+        # in the prompt, so no part of the conversation is in neither
+        recent = [msg for i, msg in enumerate(recent) if i < history_limit or msg.seq > session_row.summary_seq]
+        recent = list(reversed(recent))
+        return cls(
+            session_id=session_id,
+            username=username,
+            history=[_message_dict(msg) for msg in recent],
+            facts=list(facts),
+            last_seq=recent[-1].seq if recent else -1,
+            history_limit=max(history_limit, len(recent) + 1),
+            summary=session_row.summary,
+        )
+
+    def append(self, role: str, content: str) -> list:
+        """Buffer a message and return the recent history including it"""
+        message = {"role": role, "content": content}
+        self.pending_messages.append(message)
+        self.history = (self.history + [message])[-self.history_limit:]
+        return self.history
+
+    def rename(self, name: str):
+        self.pending_name = name
+
+    def flush(self):
+        """Write buffered messages and the session name in one transaction"""
+        if not self.pending_messages and self.pending_name is None:
+            return
+        with DBSession(engine) as db:
+            for attempt in range(3):
+                for offset, message in enumerate(self.pending_messages, start=1):
+                    db.add(ChatMessage(session_id=self.session_id, seq=self.last_seq + offset, **message))
+                changes = {"updated_at": datetime.now()}
+                if self.pending_name is not None:
+                    changes["session_name"] = self.pending_name
+                db.exec(update(SessionData).where(SessionData.session_id == self.session_id).values(**changes))
+                try:
+                    db.commit()
+                    break
+                except IntegrityError:
+                    # Another request appended to this session meanwhile; append after it
+                    db.rollback()
+                    if attempt == 2:
+                        raise
+                    last_seq = db.exec(select(func.max(ChatMessage.seq)).where(ChatMessage.session_id == self.session_id)).one()
+                    self.last_seq = -1 if last_seq is None else last_seq
+        self.last_seq += len(self.pending_messages)
+        self.pending_messages = []
+        self.pending_name = None
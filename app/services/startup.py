@@ -0,0 +1,110 @@
+import asyncio
+import logging
+import os
+import time
+from typing import Dict
+
+from sqlalchemy import text
+
+from app.models.database import engine
+from app.services import llm, vector_store
+from app.utils import metrics
+from app.utils.context_builder import get_encoding
+from app.utils.embeddings import warmup as warm_embeddings
+
+# Attempts per required warmup step before the worker gives up and reports itself dead
+WARMUP_MAX_ATTEMPTS = int(os.getenv("WARMUP_MAX_ATTEMPTS", "6"))
+WARMUP_BACKOFF_BASE = float(os.getenv("WARMUP_BACKOFF_BASE", "1.0"))
+WARMUP_BACKOFF_MAX = 30.0
+
+logger = logging.getLogger(__name__)
+
+
+class Readiness:
+    """Startup progress of this worker, reported by /readyz.
+
+    A worker is ready once every required warmup step has finished. Optional
+    steps (priming the LLM pool) are recorded but can't hold readiness back:
+    a slow or unreachable backend shouldn't take the worker out of rotation.
+    Failed required steps are retried with backoff; once they run out of
+    attempts the worker is marked failed and /healthz reports it, so the
+    orchestrator restarts it instead of leaving it out of rotation for good.
+    """
+
+    def __init__(self):
+        self.ready = False
+        self.draining = False
+        self.error = None
+        self.steps: Dict[str, dict] = {}
+
+    def record(self, step: str, seconds: float, error: Exception = None, attempts: int = 1):
+        self.steps[step] = {"seconds": round(seconds, 3), "ok": error is None, "attempts": attempts}
+        if error is not None:
+            self.steps[step]["error"] = str(error)
+
+    def status(self) -> dict:
+        if self.draining:
+            state = "draining"
+        elif self.ready:
+            state = "ready"
+        elif self.error:
+            state = "failed"
+        else:
+            state = "starting"
+        return {"status": state, "steps": self.steps, **({"error": self.error} if self.error else {})}
+
+
+readiness = Readiness()
+
+
+def _check_database():
+    with engine.connect() as conn:
+        conn.execute(text("SELECT 1"))
+
+
+def _open_vector_store():
+    vector_store.get_client().heartbeat()
+
+
+async def _step(name: str, func, required: bool = True):
+    # Optional steps get one attempt: they can't hold readiness back anyway
+    attempts = WARMUP_MAX_ATTEMPTS if required else 1
+    start = time.perf_counter()
+    for attempt in range(1, attempts + 1):
+        try:
+            with metrics.span(f"startup_{name}"):
+                if asyncio.iscoroutinefunction(func):
+                    await func()
+                else:
+                    await asyncio.to_thread(func)
+        except Exception as e:
+            readiness.record(name, time.perf_counter() - start, e, attempt)
+            if not required:
+                logger.warning("Startup step %s failed (continuing): %s", name, e)
+                return
+            if attempt == attempts:
+                raise
+            delay = min(WARMUP_BACKOFF_MAX, WARMUP_BACKOFF_BASE * 2 ** (attempt - 1))
+            logger.warning("Startup step %s failed (attempt %d/%d, retrying in %.1fs): %s", name, attempt, attempts, delay, e)
+            await asyncio.sleep(delay)
+            continue
+        readiness.record(name, time.perf_counter() - start, attempts=attempt)
+        return
+
+
+async def warm_up():
+    """Open connections and load models before the worker takes traffic"""
+    try:
+        await asyncio.gather(
+            _step("database", _check_database),
+            _step("vector_store", _open_vector_store),
+            _step("embeddings", warm_embeddings),
+            _step("llm_pool", llm.client.prime, required=False),
+            # Token counting falls back to an estimate, so a failed download can't hold readiness back
+            _step("tokenizer", get_encoding, required=False),
+        )
+    except Exception as e:
+        readiness.error = f"{type(e).__name__}: {e}"
+        logger.exception("Warmup failed after retries, worker reports itself unhealthy")
+        return
+    readiness.ready = True
@@ -0,0 +1,63 @@
+import os
+
+from sqlalchemy import func, update
+from sqlmodel import Session as DBSession, select
+
+from app.models.database import ChatMessage, SessionData, engine
+from app.prompts import summary_prompt
+from app.services import llm
+from app.services.session import HISTORY_LIMIT
+
+# Fold once at least this many messages have slid out of the history window
+SUMMARY_MIN_FOLD = int(os.getenv("SUMMARY_MIN_FOLD", "4"))
+# Most messages folded into the summary by one LLM call
+SUMMARY_MAX_FOLD = int(os.getenv("SUMMARY_MAX_FOLD", "40"))
+SUMMARY_MAX_WORDS = int(os.getenv("SUMMARY_MAX_WORDS", "200"))
+
+
+def summarize_session(session_id: str, history_limit: int = HISTORY_LIMIT, username: str = None) -> bool:
+    """Fold messages older than the history window into the session's summary.
+
+    The summary is updated incrementally: only messages after summary_seq are
+    sent, together with the current summary, and summary_seq advances to the
+    last message folded. Returns whether the summary changed.
+    """
+    with DBSession(engine) as db:
+        session = db.exec(
+            select(SessionData.summary, SessionData.summary_seq).where(SessionData.session_id == session_id)
+        ).first()
+        if session is None:
+            return False
+        unsummarized = db.exec(
+            select(func.count()).select_from(ChatMessage).where(
+                ChatMessage.session_id == session_id, ChatMessage.seq > session.summary_seq
+            )
+        ).one()
+        foldable = unsummarized - history_limit
+        if foldable < SUMMARY_MIN_FOLD:
+            return False
+        messages = db.exec(
+            select(ChatMessage)
+            .where(ChatMessage.session_id == session_id, ChatMessage.seq > session.summary_seq)
+            .order_by(ChatMessage.seq)
+            .limit(min(foldable, SUMMARY_MAX_FOLD))
+        ).all()
+
+    prompt = summary_prompt.PROMPT.format(
+        summary=session.summary or "",
+        messages="\n".join(f"{msg.role}: {msg.content}" for msg in messages),
+        max_words=SUMMARY_MAX_WORDS,
+    )
+    summary = llm.ask_llm(prompt, session_id, purpose="summary", user=username).strip()
+    if not summary:
+        return False
+
+    with DBSession(engine) as db:
+        # Only advance from the state this summary was built on
+        result = db.exec(
+            update(SessionData)
+            .where(SessionData.session_id == session_id, SessionData.summary_seq == session.summary_seq)
+            .values(summary=summary, summary_seq=messages[-1].seq)
+        )
+        db.commit()
+    return result.rowcount == 1
@@ -0,0 +1,54 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+from sqlmodel import Session as DBSession, select
+
+from app.models.database import User, engine
+
+USER_DIRECTORY_SIZE = int(os.getenv("USER_DIRECTORY_SIZE", "50000"))
+
+
+class UserDirectory:
+    """Bounded username -> user id cache in front of the user table.
+
+    Usernames and ids never change once a user exists, so entries don't need
+    invalidating; signup writes new users through, and misses fall back to a
+    single indexed lookup. Unknown usernames are not cached, so a user created
+    by another worker is found on the next lookup.
+    """
+
+    def __init__(self, max_size: int = USER_DIRECTORY_SIZE):
+        self.max_size = max_size
+        self.entries: "OrderedDict[str, int]" = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_id(self, username: str) -> Optional[int]:
+        with self.lock:
+            user_id = self.entries.get(username)
+            if user_id is not None:
+                self.entries.move_to_end(username)
+                self.hits += 1
+                return user_id
+            self.misses += 1
+        with DBSession(engine) as db:
+            user_id = db.exec(select(User.id).where(User.username == username)).first()
+        if user_id is not None:
+            self.put(username, user_id)
+        return user_id
+
+    def put(self, username: str, user_id: int):
+        with self.lock:
+            self.entries[username] = user_id
+            self.entries.move_to_end(username)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        return {"size": len(self.entries), "max_size": self.max_size, "hits": self.hits, "misses": self.misses}
+
+
+user_directory = UserDirectory()
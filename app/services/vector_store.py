@@ -1,24 +1,104 @@
-import chromadb
+from typing import Sequence
+import hashlib
+import os
+import threading
 # from chromadb.utils import embedding_functions
 
-client = chromadb.Client()
-collection = client.create_collection(name="messages")
+# Stored next to the SQLite database so both survive restarts together
+db_path = os.getenv("DATABASE_PATH", "/app/data/mydb.sqlite")
+vector_store_path = os.getenv("VECTOR_STORE_PATH", os.path.join(os.path.dirname(db_path), "chroma"))
 
-def add_message_embedding(message:str,embedding:list[float],username:str,session_id:str,msg_id:str):
-    user_session = f"{username}:{session_id}"
+# One collection per user, so a query only ever searches that user's vectors
+_client = None
+_client_lock = threading.Lock()
+_collections = {}
+_collections_lock = threading.Lock()
 
-    collection.add(
+
+def get_client():
+    """The persistent Chroma client, opened on first use rather than at import"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                import chromadb
+                _client = chromadb.PersistentClient(path=vector_store_path)
+    return _client
+
+
+def collection_name(username: str, kind: str = "messages") -> str:
+    # Chroma names allow 3-63 characters of [a-zA-Z0-9._-], so hash the username
+    return f"{kind}-" + hashlib.sha256(username.encode("utf-8")).hexdigest()[:40]
+
+
+def get_collection(username: str, kind: str = "messages"):
+    name = collection_name(username, kind)
+    collection = _collections.get(name)
+    if collection is None:
+        with _collections_lock:
+            collection = _collections.get(name)
+            if collection is None:
+                collection = get_client().get_or_create_collection(
+                    name=name,
+                    metadata={"username": username, "hnsw:space": "cosine"},
+                )
+                _collections[name] = collection
+    return collection
+
+
+def _metadata(username: str, session_id: str) -> dict:
+    return {"user_session": f"{username}:{session_id}", "session_id": session_id}
+
+
+def add_message_embedding(message:str,embedding:Sequence[float],username:str,session_id:str,msg_id:str):
+    get_collection(username).add(
         documents =[message],
         embeddings=[embedding],
-        metadatas=[{"user_session": user_session}],
+        metadatas=[_metadata(username, session_id)],
         ids = [msg_id]
     )
 
-def query_similar_messages(query_embedding:list[float],username:str,session_id:str,n_results=5):
+def add_message_embeddings(messages:list[str],embeddings:Sequence[Sequence[float]],usernames:list[str],session_ids:list[str],msg_ids:list[str],upsert:bool=False):
+    """Bulk version of add_message_embedding, one write per user partition.
+
+    With upsert=True existing ids are overwritten, which makes re-indexing idempotent.
+    """
+    partitions = {}
+    for message, embedding, username, session_id, msg_id in zip(messages, embeddings, usernames, session_ids, msg_ids):
+        rows = partitions.setdefault(username, ([], [], [], []))
+        rows[0].append(message)
+        rows[1].append(embedding)
+        rows[2].append(_metadata(username, session_id))
+        rows[3].append(msg_id)
+    for username, (documents, vectors, metadatas, ids) in partitions.items():
+        collection = get_collection(username)
+        write = collection.upsert if upsert else collection.add
+        write(
+            documents=documents,
+            embeddings=vectors,
+            metadatas=metadatas,
+            ids=ids
+        )
+
+def drop_all_collections():
+    """Delete every user partition, e.g. before re-embedding with a new model"""
+    client = get_client()
+    with _collections_lock:
+        for collection in client.list_collections():
+            name = collection if isinstance(collection, str) else collection.name
+            if name.startswith("messages-"):
+                client.delete_collection(name)
+        _collections.clear()
+
+def query_similar_messages(query_embedding:Sequence[float],username:str,session_id:str,n_results=5):
+    collection = get_collection(username)
+    # Querying an empty partition is a wasted round trip (and an error in some Chroma versions)
+    if collection.count() == 0:
+        return []
     results = collection.query(
         query_embeddings = [query_embedding],
         n_results=n_results,
-        where={"user_session":f"{username}:{session_id}"}
+        where={"session_id": session_id}
     )
     # ChromaDB returns documents as a list of lists, flatten it
     documents = results.get("documents", [[]])
@@ -26,3 +106,57 @@ def query_similar_messages(query_embedding:list[float],username:str,session_id:s
         return [(doc,) for doc in documents[0]]  # Return as list of tuples for compatibility
     return []
 
+def query_user_messages(query_embedding:Sequence[float],username:str,n_results=20):
+    """Nearest interactions across all of a user's sessions as (doc_id, document, session_id, similarity)"""
+    collection = get_collection(username)
+    count = collection.count()
+    if count == 0:
+        return []
+    results = collection.query(
+        query_embeddings=[query_embedding],
+        n_results=min(n_results, count),
+        include=["documents", "metadatas", "distances"]
+    )
+    return [
+        (doc_id, document, (metadata or {}).get("session_id"), 1 - distance)
+        for doc_id, document, metadata, distance in zip(
+            results["ids"][0], results["documents"][0], results["metadatas"][0], results["distances"][0]
+        )
+    ]
+
+
+# Fact index: one embedding per stored UserFact, keyed by the fact's id
+
+def add_fact_embeddings(username:str,fact_ids:list[int],contents:list[str],fact_types:list[str],embeddings:Sequence[Sequence[float]]):
+    if not fact_ids:
+        return
+    get_collection(username, "facts").upsert(
+        documents=list(contents),
+        embeddings=embeddings,
+        metadatas=[{"fact_type": fact_type or ""} for fact_type in fact_types],
+        ids=[str(fact_id) for fact_id in fact_ids]
+    )
+
+def delete_fact_embeddings(username:str,fact_ids:list[int]):
+    if fact_ids:
+        get_collection(username, "facts").delete(ids=[str(fact_id) for fact_id in fact_ids])
+
+def indexed_fact_ids(username:str) -> set[int]:
+    return {int(fact_id) for fact_id in get_collection(username, "facts").get(include=[])["ids"]}
+
+def query_similar_facts(query_embedding:Sequence[float],username:str,n_results=5,fact_type:str=None):
+    """Nearest stored facts as (fact_id, similarity) pairs, most similar first"""
+    collection = get_collection(username, "facts")
+    count = collection.count()
+    if count == 0:
+        return []
+    results = collection.query(
+        query_embeddings=[query_embedding],
+        n_results=min(n_results, count),
+        where={"fact_type": fact_type} if fact_type else None,
+        include=["distances"]
+    )
+    ids = results.get("ids", [[]])[0]
+    distances = results.get("distances", [[]])[0]
+    # Collections use cosine distance, so similarity is 1 - distance
+    return [(int(fact_id), 1 - distance) for fact_id, distance in zip(ids, distances)]
@@ -0,0 +1,151 @@
+import logging
+import os
+import re
+import threading
+from typing import List, Sequence
+
+logger = logging.getLogger(__name__)
+
+# Upper bound on the tokens of context sent with each chat turn
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "2000"))
+CONTEXT_TOKENIZER = os.getenv("CONTEXT_TOKENIZER", "cl100k_base")
+
+# Loaded on first use: on a cold cache tiktoken downloads the BPE file, which
+# must not happen (or hang, offline) while app.main is being imported
+_encoding = None
+_encoding_loaded = False
+_encoding_lock = threading.Lock()
+
+# Shorter messages ("hi", "thanks") are only matched as whole interactions
+MIN_OVERLAP_CHARS = 20
+
+# Rough stand-in when tiktoken is unavailable: words and punctuation
+_TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+
+
+def get_encoding():
+    """The tiktoken encoding, or None when tiktoken is missing or the encoding can't be loaded"""
+    global _encoding, _encoding_loaded
+    if not _encoding_loaded:
+        with _encoding_lock:
+            if not _encoding_loaded:
+                try:
+                    import tiktoken
+                    _encoding = tiktoken.get_encoding(CONTEXT_TOKENIZER)
+                except Exception as e:  # not installed, or the encoding can't be loaded offline
+                    logger.warning("Token counting falls back to an estimate: %s", e)
+                _encoding_loaded = True
+    return _encoding
+
+
+def count_tokens(text: str) -> int:
+    if not text:
+        return 0
+    encoding = get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    # BPE tokenizers split long words, so count roughly one token per 4 characters of a word
+    return sum(max(1, len(token) // 4) for token in _TOKEN_PATTERN.findall(text))
+
+
+def _normalize(text: str) -> str:
+    return re.sub(r"\s+", " ", text or "").strip().lower()
+
+
+def format_facts(facts: Sequence) -> List[str]:
+    """One terse "type: content" line per distinct fact"""
+    lines = []
+    seen = set()
+    for fact in facts:
+        fact_type = getattr(fact, "fact_type", None) or "fact"
+        content = getattr(fact, "fact_content", None) or ""
+        key = (_normalize(fact_type), _normalize(content))
+        if content and key not in seen:
+            seen.add(key)
+            lines.append(f"- {fact_type}: {content}")
+    return lines
+
+
+def drop_overlapping_hits(hits: Sequence[str], history: Sequence[dict]) -> List[str]:
+    """Retrieval hits that don't repeat a turn already in the recent history.
+
+    Interaction texts are stored as the user message and the reply on separate
+    lines, so a hit overlaps when it is such a pair from the history, or when
+    it contains (or is contained in) a history message long enough for the
+    match to mean something.
+    """
+    pairs = {
+        _normalize(f"{msg.get('content', '')}\n{reply.get('content', '')}")
+        for msg, reply in zip(history, history[1:])
+        if msg.get("role") == "user" and reply.get("role") == "assistant"
+    }
+    history_texts = [_normalize(msg.get("content")) for msg in history]
+    history_texts = [text for text in history_texts if len(text) >= MIN_OVERLAP_CHARS]
+    kept = []
+    seen = set()
+    for hit in hits:
+        text = _normalize(hit)
+        if not text or text in seen or text in pairs:
+            continue
+        if any(msg in text or (len(text) >= MIN_OVERLAP_CHARS and text in msg) for msg in history_texts):
+            continue
+        seen.add(text)
+        kept.append(hit)
+    return kept
+
+
+def build_context(
+    facts: Sequence,
+    similar: Sequence[str],
+    history: Sequence[dict],
+    summary: str = None,
+    budget: int = CONTEXT_TOKEN_BUDGET,
+) -> str:
+    """Assemble the prompt context within a token budget.
+
+    Items are admitted by priority until the budget is spent: the current
+    message, then the session's rolling summary, then recent turns newest
+    first, then user facts, then retrieval hits in rank order. Sections are
+    rendered in the usual order, with the kept history back in chronological
+    order.
+    """
+    history = list(history)
+    current, earlier = history[-1:], history[:-1]
+    hits = drop_overlapping_hits(similar, history)
+
+    candidates = (
+        [("history", len(history) - 1, msg) for msg in current]
+        + ([("summary", 0, summary)] if summary else [])
+        + [("history", i, earlier[i]) for i in reversed(range(len(earlier)))]
+        + [("facts", i, line) for i, line in enumerate(format_facts(facts))]
+        + [("similar", i, hit) for i, hit in enumerate(hits)]
+    )
+    headers = {
+        "facts": "USER DETAILS:",
+        "summary": "CONVERSATION SO FAR:",
+        "similar": "ADDITIONAL INFORMATION:",
+        "history": "PAST MESSAGES:",
+    }
+
+    kept = {section: {} for section in headers}
+    used = 0
+    history_truncated = False
+    for section, position, item in candidates:
+        if section == "history" and history_truncated:
+            continue
+        text = f"{item['role']}: {item['content']}" if section == "history" else item
+        cost = count_tokens(text) + (count_tokens(headers[section]) if not kept[section] else 0)
+        # The current message always goes in, even over budget
+        if used + cost > budget and not (section == "history" and position == len(history) - 1):
+            # Older turns would leave a gap in the conversation
+            history_truncated = history_truncated or section == "history"
+            continue
+        kept[section][position] = text
+        used += cost
+
+    parts = []
+    for section in headers:
+        if kept[section]:
+            lines = [kept[section][position] for position in sorted(kept[section])]
+            parts.append(headers[section] + "\n" + "\n".join(lines))
+    return "\n".join(parts)
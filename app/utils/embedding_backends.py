@@ -0,0 +1,183 @@
+"""Embedding model backends, selected with EMBEDDING_BACKEND.
+
+    torch  sentence-transformers on PyTorch (the reference model)
+    onnx   int8-quantized ONNX Runtime export of the same model
+    fake   deterministic hashing embedder for load tests
+
+All three return L2-normalized float32 vectors of the same dimension, so the
+vector store doesn't care which one wrote a vector. Build the ONNX export
+once, on a machine with the torch stack installed:
+
+    python -m app.utils.embedding_backends --export /app/data/minilm-onnx
+
+The export directory holds the quantized model, its tokenizer and a few
+reference vectors from the torch model; the onnx backend re-embeds those on
+load and refuses to start if any falls below EMBEDDING_MIN_COSINE.
+"""
+import argparse
+import hashlib
+import json
+import os
+
+import numpy as np
+
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+EMBEDDING_ONNX_PATH = os.getenv("EMBEDDING_ONNX_PATH", "/app/data/minilm-onnx")
+EMBEDDING_MIN_COSINE = float(os.getenv("EMBEDDING_MIN_COSINE", "0.99"))
+# all-MiniLM-L6-v2 truncates inputs at 256 word pieces
+EMBEDDING_MAX_LENGTH = 256
+
+REFERENCE_TEXTS = [
+    "hi",
+    "Can you help me plan a weekend trip to Lisbon?",
+    "I prefer trains to planes and I love seafood.",
+    "My name is Sam and I work as a data engineer in Berlin.",
+    "Actually I stopped drinking coffee, I only drink tea now.",
+    "What should I pack for three days of hiking in early spring when the weather is unpredictable?",
+]
+
+
+class TorchBackend:
+    def __init__(self, model_name: str = EMBEDDING_MODEL):
+        from sentence_transformers import SentenceTransformer
+        self.model = SentenceTransformer(model_name)
+
+    @property
+    def dimension(self) -> int:
+        return self.model.get_sentence_embedding_dimension()
+
+    def encode(self, texts: list[str], batch_size: int = 32) -> np.ndarray:
+        return self.model.encode(texts, batch_size=batch_size, convert_to_numpy=True, normalize_embeddings=True)
+
+
+class OnnxBackend:
+    """Quantized ONNX export run with ONNX Runtime, without importing torch.
+
+    Reproduces the sentence-transformers pipeline: word-piece tokenization,
+    the transformer, mean pooling over non-padding tokens, L2 normalization.
+    """
+
+    def __init__(self, path: str = EMBEDDING_ONNX_PATH, min_cosine: float = EMBEDDING_MIN_COSINE):
+        import onnxruntime
+        from tokenizers import Tokenizer
+
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = onnxruntime.InferenceSession(
+            os.path.join(path, "model_quantized.onnx"), options, providers=["CPUExecutionProvider"]
+        )
+        self.input_names = {i.name for i in self.session.get_inputs()}
+        self.tokenizer = Tokenizer.from_file(os.path.join(path, "tokenizer.json"))
+        self.tokenizer.enable_truncation(EMBEDDING_MAX_LENGTH)
+        self.tokenizer.enable_padding()
+        with open(os.path.join(path, "reference.json")) as f:
+            reference = json.load(f)
+        self.dimension = len(reference["vectors"][0])
+        self.check(reference, min_cosine)
+
+    def check(self, reference: dict, min_cosine: float):
+        vectors = self.encode(reference["texts"])
+        similarities = np.sum(vectors * np.asarray(reference["vectors"], dtype=np.float32), axis=1)
+        if similarities.min() < min_cosine:
+            raise ValueError(
+                f"ONNX embeddings drift from the reference model: min cosine {similarities.min():.4f} < {min_cosine}"
+            )
+
+    def encode(self, texts: list[str], batch_size: int = 32) -> np.ndarray:
+        if not texts:
+            return np.empty((0, self.dimension), dtype=np.float32)
+        batches = []
+        for start in range(0, len(texts), batch_size):
+            encodings = self.tokenizer.encode_batch(texts[start:start + batch_size])
+            feeds = {
+                "input_ids": np.array([e.ids for e in encodings], dtype=np.int64),
+                "attention_mask": np.array([e.attention_mask for e in encodings], dtype=np.int64),
+                "token_type_ids": np.array([e.type_ids for e in encodings], dtype=np.int64),
+            }
+            hidden = self.session.run(None, {k: v for k, v in feeds.items() if k in self.input_names})[0]
+            mask = feeds["attention_mask"][..., None].astype(np.float32)
+            pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            batches.append(pooled / np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None))
+        return np.concatenate(batches).astype(np.float32)
+
+
+class FakeBackend:
+    """Deterministic stand-in for the sentence-transformers model.
+
+    Each word is hashed into one of `dimension` buckets with a hashed sign, and
+    the counts are L2-normalized, so texts sharing words still come out
+    similar and retrieval behaves plausibly, at a tiny fraction of the cost.
+    """
+
+    def __init__(self, dimension: int = 384):
+        self.dimension = dimension
+
+    def encode(self, texts: list[str], batch_size: int = 32) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dimension), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for word in text.lower().split():
+                digest = hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest()
+                bucket = int.from_bytes(digest[:4], "little") % self.dimension
+                vectors[row, bucket] += 1.0 if digest[4] & 1 else -1.0
+            norm = np.linalg.norm(vectors[row])
+            if norm:
+                vectors[row] /= norm
+        return vectors
+
+
+BACKENDS = {"torch": TorchBackend, "onnx": OnnxBackend, "fake": FakeBackend}
+
+
+def create_backend(name: str):
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown embedding backend: {name}")
+    return BACKENDS[name]()
+
+
+def export_onnx(output: str, model_name: str = EMBEDDING_MODEL):
+    """Export the transformer to ONNX, quantize its weights to int8 and save reference vectors"""
+    import torch
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    from transformers import AutoModel, AutoTokenizer
+
+    os.makedirs(output, exist_ok=True)
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    model = AutoModel.from_pretrained(model_name).eval()
+    sample = tokenizer(["an example sentence"], return_tensors="pt")
+    fp32_path = os.path.join(output, "model.onnx")
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            (sample["input_ids"], sample["attention_mask"], sample["token_type_ids"]),
+            fp32_path,
+            input_names=["input_ids", "attention_mask", "token_type_ids"],
+            output_names=["last_hidden_state"],
+            dynamic_axes={
+                name: {0: "batch", 1: "sequence"}
+                for name in ("input_ids", "attention_mask", "token_type_ids", "last_hidden_state")
+            },
+            opset_version=14,
+        )
+    quantize_dynamic(fp32_path, os.path.join(output, "model_quantized.onnx"), weight_type=QuantType.QInt8)
+    os.remove(fp32_path)
+    tokenizer.backend_tokenizer.save(os.path.join(output, "tokenizer.json"))
+
+    reference = TorchBackend(model_name).encode(REFERENCE_TEXTS)
+    with open(os.path.join(output, "reference.json"), "w") as f:
+        json.dump({"model": model_name, "texts": REFERENCE_TEXTS, "vectors": reference.tolist()}, f)
+    print(f"Exported {model_name} to {output}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the quantized ONNX embedding backend")
+    parser.add_argument("--export", metavar="DIR", default=EMBEDDING_ONNX_PATH, help="Output directory")
+    parser.add_argument("--model", default=EMBEDDING_MODEL)
+    args = parser.parse_args()
+    export_onnx(args.export, args.model)
+    # Loading runs the cosine check against the reference vectors just written
+    backend = OnnxBackend(args.export)
+    print(f"ONNX backend loaded, dimension {backend.dimension}")
+
+
+if __name__ == "__main__":
+    main()
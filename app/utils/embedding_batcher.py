@@ -0,0 +1,96 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import Callable, List
+
+import numpy as np
+
+
+@dataclass
+class EncodeRequest:
+    texts: List[str]
+    future: Future = field(default_factory=Future)
+
+
+class EmbeddingBatcher:
+    """Coalesces encode calls from concurrent callers into batched forward passes.
+
+    A single scheduler thread takes the first pending request, keeps collecting
+    requests for up to max_wait_ms or until max_batch_size texts are queued,
+    encodes them all in one call and hands every caller back its own rows.
+    A request is never split across batches, so a caller submitting more than
+    max_batch_size texts simply gets a batch of its own.
+    """
+
+    def __init__(self, encode: Callable[[List[str]], np.ndarray], max_batch_size: int = 32, max_wait_ms: float = 5):
+        self.encode = encode
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.requests: "queue.Queue[EncodeRequest]" = queue.Queue()
+        self.thread = None
+        self.lock = threading.Lock()
+        self.batches = 0
+        self.texts = 0
+        self.requests_served = 0
+
+    def _ensure_started(self):
+        if self.thread is None:
+            with self.lock:
+                if self.thread is None:
+                    self.thread = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+                    self.thread.start()
+
+    def submit(self, texts: List[str]) -> Future:
+        self._ensure_started()
+        request = EncodeRequest(texts=list(texts))
+        self.requests.put(request)
+        return request.future
+
+    def encode_many(self, texts: List[str]) -> np.ndarray:
+        return self.submit(texts).result()
+
+    def _collect(self) -> List[EncodeRequest]:
+        batch = [self.requests.get()]
+        size = len(batch[0].texts)
+        deadline = time.monotonic() + self.max_wait
+        while size < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                request = self.requests.get(timeout=remaining)
+            except queue.Empty:
+                break
+            batch.append(request)
+            size += len(request.texts)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            texts = [text for request in batch for text in request.texts]
+            try:
+                vectors = self.encode(texts)
+            except Exception as e:
+                for request in batch:
+                    request.future.set_exception(e)
+                continue
+            offset = 0
+            for request in batch:
+                request.future.set_result(vectors[offset:offset + len(request.texts)])
+                offset += len(request.texts)
+            self.batches += 1
+            self.texts += len(texts)
+            self.requests_served += len(batch)
+
+    def stats(self) -> dict:
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000,
+            "batches": self.batches,
+            "texts": self.texts,
+            "requests": self.requests_served,
+            "avg_batch_size": round(self.texts / self.batches, 2) if self.batches else 0.0,
+        }
@@ -1,6 +1,135 @@
-from sentence_transformers import SentenceTransformer
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
 
-model = SentenceTransformer("all-MiniLM-L6-v2")
+import numpy as np
 
-def get_embedding(text:str)->list[float]:
-    return model.encode(text).tolist()
\ No newline at end of file
+from app.utils.embedding_backends import create_backend
+from app.utils.embedding_batcher import EmbeddingBatcher
+
+# torch, onnx or fake; see app/utils/embedding_backends.py
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")
+
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "4096"))
+EMBEDDING_CACHE_TTL = float(os.getenv("EMBEDDING_CACHE_TTL", "3600"))
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "64"))
+# Micro-batching of encode calls across concurrent requests; 0 ms disables it
+EMBEDDING_BATCH_WAIT_MS = float(os.getenv("EMBEDDING_BATCH_WAIT_MS", "5"))
+EMBEDDING_MAX_BATCH = int(os.getenv("EMBEDDING_MAX_BATCH", "32"))
+
+_model = None
+_model_lock = threading.Lock()
+
+
+def get_model():
+    """The embedding backend, loaded on first use rather than at import"""
+    global _model
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                _model = create_backend(EMBEDDING_BACKEND)
+    return _model
+
+
+def warmup():
+    """Load the backend and run a dummy batch, so the first request doesn't pay for it"""
+    get_model().encode(["warmup", "a slightly longer warmup sentence for the model"], batch_size=EMBEDDING_BATCH_SIZE)
+
+
+def encode(texts: list[str]) -> np.ndarray:
+    return get_model().encode(texts, batch_size=EMBEDDING_BATCH_SIZE)
+
+
+class EmbeddingCache:
+    """Bounded LRU of embeddings keyed by content hash, with a TTL"""
+
+    def __init__(self, max_size: int = EMBEDDING_CACHE_SIZE, ttl: float = EMBEDDING_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(text: str) -> str:
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def get(self, key: str):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or time.monotonic() - entry[0] > self.ttl:
+                if entry is not None:
+                    del self.entries[key]
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: str, vector: np.ndarray):
+        if self.max_size <= 0:
+            return
+        # Cached vectors are shared between callers, so make them read-only
+        vector.setflags(write=False)
+        with self.lock:
+            self.entries[key] = (time.monotonic(), vector)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self.entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+cache = EmbeddingCache()
+batcher = EmbeddingBatcher(encode, max_batch_size=EMBEDDING_MAX_BATCH, max_wait_ms=EMBEDDING_BATCH_WAIT_MS)
+
+
+def get_embeddings(texts: list[str]) -> np.ndarray:
+    """Embed many texts, sending only the distinct cache misses to the model"""
+    keys = [cache.key(text) for text in texts]
+    vectors = [cache.get(key) for key in keys]
+
+    # Encode each distinct missing text once
+    missing = {}
+    for text, key, vector in zip(texts, keys, vectors):
+        if vector is None and key not in missing:
+            missing[key] = text
+    if missing:
+        texts_to_encode = list(missing.values())
+        encoded = batcher.encode_many(texts_to_encode) if EMBEDDING_BATCH_WAIT_MS > 0 else encode(texts_to_encode)
+        for key, vector in zip(missing, encoded):
+            cache.put(key, vector)
+        fresh = dict(zip(missing, encoded))
+        vectors = [fresh[key] if vector is None else vector for key, vector in zip(keys, vectors)]
+
+    if not vectors:
+        return np.empty((0, get_model().dimension), dtype=np.float32)
+    return np.stack(vectors)
+
+
+def get_embedding(text: str) -> np.ndarray:
+    return get_embeddings([text])[0]
+
+
+def cache_stats() -> dict:
+    return cache.stats()
+
+
+def embedding_stats() -> dict:
+    return {
+        "backend": EMBEDDING_BACKEND,
+        "loaded": _model is not None,
+        "cache": cache.stats(),
+        "batching": batcher.stats(),
+    }
@@ -0,0 +1,43 @@
+"""Conditional GET support for endpoints that clients poll.
+
+Endpoints compute a cheap version tag (a max(seq), a count and max(updated_at))
+before loading anything; a client that sends the tag back in If-None-Match
+gets an empty 304 and the payload is never built.
+"""
+import hashlib
+from typing import Callable
+
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+# Clients may keep a copy but must revalidate it on every use
+CACHE_CONTROL = "private, no-cache"
+
+
+def etag(*parts) -> str:
+    """Tag from the data version plus every parameter that shapes the payload"""
+    digest = hashlib.blake2b(repr(parts).encode("utf-8"), digest_size=8).hexdigest()
+    # Weak: the same data may be served with different encodings
+    return f'W/"{digest}"'
+
+
+def _opaque(tag: str) -> str:
+    return tag[2:] if tag.startswith("W/") else tag
+
+
+def matches(request: Request, tag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    return any(_opaque(candidate.strip()) == _opaque(tag) for candidate in header.split(","))
+
+
+def conditional(request: Request, tag: str, build: Callable[[], object]) -> Response:
+    """304 if the client already holds tag, otherwise build() as JSON with the tag attached"""
+    headers = {"ETag": tag, "Cache-Control": CACHE_CONTROL}
+    if matches(request, tag):
+        return Response(status_code=304, headers=headers)
+    return JSONResponse(jsonable_encoder(build()), headers=headers)
@@ -0,0 +1,221 @@
+"""In-process metrics in the Prometheus text exposition format.
+
+Counters and histograms are plain dicts of floats behind one lock per metric,
+so recording a sample costs a dict lookup and a few additions; there is no
+background thread and nothing is exported until /metrics is scraped.
+
+span() times a block into the stage histogram and, while a request is being
+timed with request_timings(), into that request's Server-Timing breakdown.
+"""
+import bisect
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional, Sequence, Tuple
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_registry = []
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _le(bound) -> str:
+    return f'le="{bound}"'
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.values: Dict[Tuple, float] = {}
+        self.lock = threading.Lock()
+        _registry.append(self)
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0.0) + amount
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self.lock:
+            for key, value in sorted(self.values.items()):
+                lines.append(f"{self.name}{_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+class Gauge(Counter):
+    def set(self, value: float, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        with self.lock:
+            self.values[key] = value
+
+    def render(self) -> list:
+        lines = super().render()
+        lines[1] = f"# TYPE {self.name} gauge"
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [per-bucket counts..., +Inf count, sum]
+        self.values: Dict[Tuple, list] = {}
+        self.lock = threading.Lock()
+        _registry.append(self)
+
+    def observe(self, value: float, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            counts = self.values.get(key)
+            if counts is None:
+                counts = self.values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            counts[index] += 1
+            counts[-1] += value
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            for key, counts in sorted(self.values.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, counts):
+                    cumulative += count
+                    lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, _le(bound))} {cumulative}")
+                cumulative += counts[len(self.buckets)]
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, _le('+Inf'))} {cumulative}")
+                lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {counts[-1]}")
+                lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+def render() -> str:
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+http_request_seconds = Histogram(
+    "http_request_seconds", "HTTP request latency until the response starts", ["method", "route", "status"]
+)
+stage_seconds = Histogram("stage_seconds", "Latency of instrumented stages", ["stage"])
+stage_errors_total = Counter("stage_errors_total", "Instrumented stages that raised", ["stage"])
+llm_request_seconds = Histogram("llm_request_seconds", "LLM call latency, retries included", ["purpose", "outcome"])
+llm_requests_total = Counter("llm_requests_total", "LLM calls by purpose and outcome", ["purpose", "outcome"])
+llm_tokens_total = Counter("llm_tokens_total", "Tokens reported by the LLM backend", ["purpose", "kind"])
+llm_queue_wait_seconds = Histogram(
+    "llm_queue_wait_seconds", "Time LLM calls waited for an admission slot", ["priority"],
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0),
+)
+llm_queue_depth = Gauge("llm_queue_depth", "LLM calls waiting for an admission slot", ["priority"])
+llm_in_flight = Gauge("llm_in_flight", "LLM calls currently holding an admission slot")
+llm_concurrency_limit = Gauge("llm_concurrency_limit", "Current adaptive cap on concurrent LLM calls")
+llm_throttled_total = Counter("llm_throttled_total", "429 responses from the LLM backend")
+retrieval_timeouts_total = Counter(
+    "retrieval_timeouts_total", "Retrievers cut off by the retrieval time budget", ["retriever"]
+)
+memory_queue_depth = Gauge("memory_queue_depth", "Chat turns waiting for the memory worker")
+memory_lag_seconds = Gauge("memory_lag_seconds", "Queue wait of the last memory batch")
+
+_timings: contextvars.ContextVar[Optional[list]] = contextvars.ContextVar("request_timings", default=None)
+
+
+@contextmanager
+def request_timings():
+    """Collect the spans of the current request (including its pipeline stages)"""
+    timings = []
+    token = _timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _timings.reset(token)
+
+
+def add_timing(name: str, seconds: float):
+    """Add an entry to the current request's timing breakdown, if one is being collected"""
+    timings = _timings.get()
+    if timings is not None:
+        timings.append((name, seconds))
+
+
+def record(stage: str, seconds: float):
+    stage_seconds.observe(seconds, stage=stage)
+    add_timing(stage, seconds)
+
+
+@contextmanager
+def span(stage: str):
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        stage_errors_total.inc(stage=stage)
+        raise
+    finally:
+        record(stage, time.perf_counter() - start)
+
+
+def server_timing(timings: Sequence[Tuple[str, float]]) -> str:
+    return ", ".join(f"{stage.replace(' ', '_')};dur={seconds * 1000:.1f}" for stage, seconds in timings)
+
+
+def _route(scope) -> str:
+    """The path template of the matched route, e.g. /session/{username}"""
+    template = getattr(scope.get("route"), "path", None)
+    if scope.get("endpoint") is None or template is None:
+        return "unmatched"
+    # Newer FastAPI versions give an included router's route without the
+    # router's prefix; the prefix is the leading segments the template lacks
+    segments = scope["path"].split("/")
+    depth = len(segments) - len(template.split("/"))
+    return "/".join(segments[:depth + 1]) + template if depth > 0 else template
+
+
+class MetricsMiddleware:
+    """ASGI middleware timing every HTTP request.
+
+    Requests are labelled by their route template rather than the raw path,
+    so ids in URLs don't create new series. With timing_header set, responses
+    carry a Server-Timing header with the spans recorded before the response
+    started (for a streamed chat answer: everything up to the first token).
+    """
+
+    def __init__(self, app, timing_header: bool = False):
+        self.app = app
+        self.timing_header = timing_header
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        start = time.perf_counter()
+
+        with request_timings() as timings:
+            async def send_wrapper(message):
+                if message["type"] == "http.response.start":
+                    elapsed = time.perf_counter() - start
+                    http_request_seconds.observe(
+                        elapsed, method=scope["method"], route=_route(scope), status=message["status"]
+                    )
+                    if self.timing_header:
+                        header = server_timing(timings + [("total", elapsed)])
+                        message["headers"] = list(message.get("headers", [])) + [(b"server-timing", header.encode())]
+                await send(message)
+
+            await self.app(scope, receive, send_wrapper)
@@ -1,9 +1,40 @@
+from datetime import datetime
+
 from app.models.database import UserFact, engine
+from sqlalchemy import func
 from sqlmodel import Session, select
 
-def get_user_facts(username: int):
+def get_user_facts(username: int, db: Session = None, include_superseded: bool = False):
+    """Current facts for a user; pass db to reuse an open session.
+
+    With include_superseded the full history is returned, oldest first.
+    """
+    query = select(UserFact).where(UserFact.user_name == username)
+    if include_superseded:
+        query = query.order_by(UserFact.valid_from, UserFact.id)
+    else:
+        query = query.where(UserFact.superseded_by.is_(None))
+    if db is not None:
+        return db.exec(query).all()
     with Session(engine) as session:
-        facts = session.exec(
-            select(UserFact).where(UserFact.user_name == username)
-        ).all()
+        facts = session.exec(query).all()
         return facts
+
+
+def facts_version(username: str) -> tuple:
+    """Fact count and latest updated_at: changes whenever a fact is added or superseded"""
+    with Session(engine) as session:
+        return tuple(session.exec(
+            select(func.count(UserFact.id), func.max(UserFact.updated_at)).where(UserFact.user_name == username)
+        ).one())
+
+
+def get_changed_facts(username: str, since: datetime) -> list:
+    """Facts added or superseded after since, superseded ones included so clients can drop them"""
+    query = (
+        select(UserFact)
+        .where(UserFact.user_name == username, UserFact.updated_at > since)
+        .order_by(UserFact.updated_at, UserFact.id)
+    )
+    with Session(engine) as session:
+        return session.exec(query).all()
@@ -0,0 +1,121 @@
+"""Cold start, memory and encode latency of the embedding backends.
+
+    python -m benchmarks.embedding_backends --backends torch onnx
+
+Each backend is measured in a fresh subprocess, the way a new worker starts:
+time to import the embeddings module (which no longer loads a model), time
+to load the backend, resident memory once loaded, and per-call / batched
+encode latency. Vectors for a shared corpus are compared with the first
+backend's; the run fails if any falls below --min-cosine.
+"""
+import argparse
+import json
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+CORPUS = [
+    "hi",
+    "thanks!",
+    "Can you help me plan a weekend trip to Lisbon?",
+    "I prefer trains to planes and I love seafood.",
+    "My name is Sam and I work as a data engineer in Berlin.",
+    "Actually I stopped drinking coffee, I only drink tea now.",
+    "What should I pack for three days of hiking in early spring?",
+    "Remind me what we decided about the hotel in Porto.",
+    "I'm allergic to peanuts, please keep that in mind for restaurant suggestions.",
+    "Summarize the plan so far in three bullet points.",
+] * 4
+
+
+def rss_mib() -> float:
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def measure(backend: str, repeats: int) -> dict:
+    """Runs inside the subprocess"""
+    import os
+    os.environ["EMBEDDING_BACKEND"] = backend
+    start = time.perf_counter()
+    from app.utils import embeddings
+    imported = time.perf_counter()
+    model = embeddings.get_model()
+    loaded = time.perf_counter()
+    vectors = model.encode(CORPUS[:10])
+    first_encode = time.perf_counter()
+
+    single = []
+    for i in range(repeats):
+        t = time.perf_counter()
+        model.encode([CORPUS[i % len(CORPUS)]])
+        single.append(time.perf_counter() - t)
+    batch = []
+    for _ in range(max(1, repeats // 10)):
+        t = time.perf_counter()
+        model.encode(CORPUS[:32], batch_size=32)
+        batch.append(time.perf_counter() - t)
+    single.sort()
+    batch.sort()
+    return {
+        "import_seconds": round(imported - start, 3),
+        "load_seconds": round(loaded - imported, 3),
+        "cold_start_seconds": round(first_encode - start, 3),
+        "rss_mib": round(rss_mib(), 1),
+        "single_p50_ms": round(single[len(single) // 2] * 1000, 2),
+        "single_p95_ms": round(single[int(len(single) * 0.95)] * 1000, 2),
+        "batch32_p50_ms": round(batch[len(batch) // 2] * 1000, 2),
+        "vectors": vectors.tolist(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--backends", nargs="+", default=["torch", "onnx"])
+    parser.add_argument("--repeats", type=int, default=200)
+    parser.add_argument("--min-cosine", type=float, default=0.99)
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(measure(args.child, args.repeats)))
+        return
+
+    report = {}
+    for backend in args.backends:
+        result = subprocess.run(
+            [sys.executable, "-m", "benchmarks.embedding_backends", "--child", backend, "--repeats", str(args.repeats)],
+            capture_output=True, text=True,
+        )
+        if result.returncode != 0:
+            print(f"{backend}: failed\n{result.stderr.strip()}")
+            continue
+        report[backend] = json.loads(result.stdout.strip().splitlines()[-1])
+
+    if not report:
+        sys.exit(1)
+    reference_name = next(iter(report))
+    reference = np.asarray(report[reference_name]["vectors"])
+    failed = False
+    for backend, result in report.items():
+        vectors = np.asarray(result.pop("vectors"))
+        result["min_cosine_vs_" + reference_name] = round(float(np.sum(vectors * reference, axis=1).min()), 5)
+        failed |= result["min_cosine_vs_" + reference_name] < args.min_cosine
+        print(f"{backend:<6} " + "  ".join(f"{key}={value}" for key, value in result.items()))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if failed:
+        print(f"Cosine similarity below {args.min_cosine} against {reference_name}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
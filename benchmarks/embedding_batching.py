@@ -0,0 +1,80 @@
+"""Throughput of per-call encoding vs. the micro-batching scheduler.
+
+    python -m benchmarks.embedding_batching --requests 512 --concurrency 1 4 16 32
+
+Each simulated request embeds one chat-sized message from its own thread,
+the way concurrent /chat handlers do. The embedding cache is bypassed so
+every call reaches the model.
+"""
+import argparse
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from app.utils.embedding_backends import BACKENDS, create_backend
+
+from app.utils.embedding_batcher import EmbeddingBatcher
+
+
+def make_texts(n: int) -> list[str]:
+    return [f"Message {i}: I'd like help planning a trip to city number {i % 97} next month." for i in range(n)]
+
+
+def run(encode_one, texts: list[str], concurrency: int) -> dict:
+    latencies = []
+
+    def call(text):
+        start = time.perf_counter()
+        encode_one(text)
+        latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(call, texts))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "throughput_per_s": round(len(texts) / elapsed, 1),
+        "p50_ms": round(latencies[len(latencies) // 2] * 1000, 2),
+        "p95_ms": round(latencies[int(len(latencies) * 0.95)] * 1000, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=512)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32])
+    parser.add_argument("--max-batch-size", type=int, default=32)
+    parser.add_argument("--max-wait-ms", type=float, default=5)
+    parser.add_argument("--backend", default="torch", choices=sorted(BACKENDS))
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    model = create_backend(args.backend)
+    texts = make_texts(args.requests)
+    model.encode(texts[:8])  # warm up
+
+    batcher = EmbeddingBatcher(
+        lambda batch: model.encode(batch),
+        max_batch_size=args.max_batch_size,
+        max_wait_ms=args.max_wait_ms,
+    )
+
+    results = []
+    for concurrency in args.concurrency:
+        per_call = run(lambda text: model.encode([text]), texts, concurrency)
+        batched = run(lambda text: batcher.encode_many([text]), texts, concurrency)
+        results.append({"concurrency": concurrency, "per_call": per_call, "batched": batched})
+        print(
+            f"concurrency={concurrency:>3}  "
+            f"per-call {per_call['throughput_per_s']:>8}/s p95 {per_call['p95_ms']:>7}ms  |  "
+            f"batched {batched['throughput_per_s']:>8}/s p95 {batched['p95_ms']:>7}ms"
+        )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"requests": args.requests, "batcher": batcher.stats(), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
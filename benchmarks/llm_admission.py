@@ -0,0 +1,133 @@
+"""Chat answer latency while background memory calls saturate a rate-limited backend.
+
+    python -m benchmarks.llm_admission --stub-max-concurrency 4 --background 200 --answers 40
+
+Starts the stub LLM with STUB_LLM_MAX_CONCURRENCY, so it answers 429 the way
+a provider does past its limit, then for each mode fires a burst of
+background calls (memory_update, spread over --users users) and, while
+that burst is queued, a steady trickle of answer calls:
+
+    off  no admission control, every call goes straight to the backend
+    on   AdmissionController capped at --max-concurrency
+
+It reports answer and background latency, failed calls, 429s seen by the
+backend and the admission queue wait per priority class. With admission on,
+answers should skip the background queue and 429s settle once the adaptive
+cap has come down to what the backend accepts.
+"""
+import argparse
+import asyncio
+import json
+import time
+
+import httpx
+
+from app.services import llm
+from app.utils import metrics
+from benchmarks.load_test import start_stub, summarize
+
+
+def queue_waits() -> dict:
+    with metrics.llm_queue_wait_seconds.lock:
+        return {key[0]: (sum(counts[:-1]), counts[-1]) for key, counts in metrics.llm_queue_wait_seconds.values.items()}
+
+
+async def timed(client: llm.LLMClient, purpose: str, user: str, latencies: dict, failures: dict):
+    start = time.perf_counter()
+    try:
+        await client.acomplete(f"{purpose} request from {user}", purpose=purpose, user=user)
+    except llm.LLMError:
+        failures[purpose] += 1
+        return
+    latencies[purpose].append(time.perf_counter() - start)
+
+
+async def run_mode(base_url: str, max_concurrency: int, args) -> dict:
+    client = llm.LLMClient(
+        base_url=base_url,
+        api_key="",
+        timeout=args.timeout,
+        max_retries=args.max_retries,
+        admission=llm.AdmissionController(max_concurrency, args.min_concurrency),
+    )
+    latencies = {"answer": [], "memory_update": []}
+    failures = {"answer": 0, "memory_update": 0}
+    before = queue_waits()
+    stub_before = httpx.get(base_url.replace("/v1", "/stats")).json()
+
+    async def answers():
+        await asyncio.sleep(args.answer_delay)
+        calls = []
+        for i in range(args.answers):
+            calls.append(asyncio.create_task(timed(client, "answer", f"chat-{i % args.users}", latencies, failures)))
+            await asyncio.sleep(args.answer_interval)
+        await asyncio.gather(*calls)
+
+    start = time.perf_counter()
+    background = [
+        timed(client, "memory_update", f"user-{i % args.users}", latencies, failures) for i in range(args.background)
+    ]
+    await asyncio.gather(answers(), *background)
+    elapsed = time.perf_counter() - start
+    await client.aclose()
+
+    stub_after = httpx.get(base_url.replace("/v1", "/stats")).json()
+    after = queue_waits()
+    waits = {}
+    for priority, (count, total) in after.items():
+        prev_count, prev_total = before.get(priority, (0, 0.0))
+        if count > prev_count:
+            waits[priority] = round((total - prev_total) / (count - prev_count) * 1000, 2)
+    return {
+        "elapsed_seconds": round(elapsed, 3),
+        "answer": dict(summarize(latencies["answer"]), failed=failures["answer"]),
+        "background": dict(summarize(latencies["memory_update"]), failed=failures["memory_update"]),
+        "backend_429s": stub_after["rejected"] - stub_before["rejected"],
+        "mean_queue_wait_ms": waits,
+        "final_limit": client.admission.limit if max_concurrency else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--modes", nargs="+", default=["off", "on"], choices=["off", "on"])
+    parser.add_argument("--stub-max-concurrency", type=int, default=4, help="Backend limit before it answers 429")
+    parser.add_argument("--stub-latency-ms", type=float, default=200)
+    parser.add_argument("--stub-jitter-ms", type=float, default=50)
+    parser.add_argument("--max-concurrency", type=int, default=16, help="Admission cap for the 'on' mode")
+    parser.add_argument("--min-concurrency", type=int, default=1)
+    parser.add_argument("--background", type=int, default=200, help="Background calls in the burst")
+    parser.add_argument("--answers", type=int, default=40, help="Answer calls fired during the burst")
+    parser.add_argument("--answer-interval", type=float, default=0.1, help="Seconds between answer calls")
+    parser.add_argument("--answer-delay", type=float, default=0.5, help="Seconds after the burst starts")
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--max-retries", type=int, default=2)
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    stub, base_url = start_stub(
+        args.stub_latency_ms, args.stub_jitter_ms, STUB_LLM_MAX_CONCURRENCY=str(args.stub_max_concurrency)
+    )
+    report = {}
+    try:
+        for mode in args.modes:
+            report[mode] = asyncio.run(run_mode(base_url, args.max_concurrency if mode == "on" else 0, args))
+    finally:
+        stub.terminate()
+        stub.wait()
+
+    print(f"{'mode':<5} {'answer p50':>11} {'answer p95':>11} {'failed':>7} {'bg p95':>9} {'bg failed':>10} {'429s':>6}  queue wait ms")
+    for mode, result in report.items():
+        print(
+            f"{mode:<5} {result['answer']['p50_ms']:>11} {result['answer']['p95_ms']:>11} {result['answer']['failed']:>7}"
+            f" {result['background']['p95_ms']:>9} {result['background']['failed']:>10} {result['backend_429s']:>6}"
+            f"  {result['mean_queue_wait_ms']}"
+        )
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
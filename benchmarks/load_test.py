@@ -0,0 +1,270 @@
+"""End-to-end load test: signup -> session -> N chat turns for M concurrent users.
+
+    python -m benchmarks.load_test --users 20 --turns 5 --stub-latency-ms 300 --fake-embedder
+    python -m benchmarks.load_test --base-url http://127.0.0.1:8000 --users 50
+    python -m benchmarks.load_test --output after.json --compare before.json
+
+By default the app runs in-process (with its lifespan) against a fresh
+database in a temporary directory, and a stub LLM (benchmarks/stub_llm.py) is
+started on a free port with the given latency; pass --llm-base-url to use a
+running backend instead. --fake-embedder swaps the embedding model for a
+deterministic hashing embedder, isolating everything that isn't inference.
+
+Per-stage timings come from the Server-Timing header, so a server started
+separately for --base-url needs METRICS_TIMING_HEADER=1 for the stage table.
+Results are written as JSON along with the git commit, so runs can be
+compared across commits with --compare.
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from collections import defaultdict
+
+import httpx
+
+MESSAGES = [
+    "Hi! My name is {name} and I live in Lisbon.",
+    "Can you help me plan a weekend trip somewhere close by?",
+    "I prefer trains to planes, and I love seafood.",
+    "What should I pack for three days in early spring?",
+    "Actually I moved to Porto last month, does that change anything?",
+    "Suggest a good book for the train ride.",
+    "I'm vegetarian now, so skip the seafood restaurants.",
+    "Thanks, can you summarize the plan?",
+]
+
+
+def percentile(sorted_values: list, q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(q * len(sorted_values) + 0.5) - 1))
+    return sorted_values[index]
+
+
+def summarize(samples: list) -> dict:
+    values = sorted(samples)
+    return {
+        "count": len(values),
+        "mean_ms": round(sum(values) / len(values) * 1000, 2) if values else 0.0,
+        "p50_ms": round(percentile(values, 0.50) * 1000, 2),
+        "p95_ms": round(percentile(values, 0.95) * 1000, 2),
+        "p99_ms": round(percentile(values, 0.99) * 1000, 2),
+        "max_ms": round(values[-1] * 1000, 2) if values else 0.0,
+    }
+
+
+def parse_server_timing(header: str) -> list:
+    timings = []
+    for entry in filter(None, (part.strip() for part in (header or "").split(","))):
+        name, _, rest = entry.partition(";")
+        for param in rest.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "dur":
+                timings.append((name.strip(), float(value) / 1000))
+    return timings
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_stub(latency_ms: float, jitter_ms: float, templates: str = None, **extra_env) -> tuple:
+    port = free_port()
+    env = dict(os.environ, STUB_LLM_LATENCY_MS=str(latency_ms), STUB_LLM_JITTER_MS=str(jitter_ms), **extra_env)
+    if templates:
+        env["STUB_LLM_TEMPLATES"] = templates
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "benchmarks.stub_llm:app", "--port", str(port), "--log-level", "warning"],
+        env=env,
+    )
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(f"http://127.0.0.1:{port}/health", timeout=1).status_code == 200:
+                return process, f"http://127.0.0.1:{port}/v1"
+        except httpx.TransportError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError("Stub LLM did not start")
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.stages = defaultdict(list)
+
+    async def request(self, client: httpx.AsyncClient, label: str, method: str, url: str, **kwargs) -> httpx.Response:
+        start = time.perf_counter()
+        try:
+            response = await client.request(method, url, **kwargs)
+        except httpx.HTTPError:
+            self.errors[label] += 1
+            raise
+        self.latencies[label].append(time.perf_counter() - start)
+        if response.status_code >= 400:
+            self.errors[label] += 1
+        for stage, seconds in parse_server_timing(response.headers.get("server-timing")):
+            if stage != "total":
+                self.stages[stage].append(seconds)
+        return response
+
+
+async def simulate_user(client: httpx.AsyncClient, recorder: Recorder, turns: int, stream: bool, run_id: str, index: int):
+    username = f"load-{run_id}-{index}"
+    await recorder.request(client, "POST /auth/signup", "POST", "/auth/signup", json={"username": username, "password": "load-test"})
+    response = await recorder.request(client, "POST /session/", "POST", "/session/", json={"username": username})
+    session_id = response.json()["session_id"]
+    for turn in range(turns):
+        message = MESSAGES[turn % len(MESSAGES)].format(name=username)
+        await recorder.request(
+            client, "POST /chat/", "POST", "/chat/",
+            json={"session_id": session_id, "username": username, "message": message, "stream": stream},
+        )
+    await recorder.request(client, "GET /session/get/{session_id}", "GET", f"/session/get/{session_id}")
+
+
+async def drive(client: httpx.AsyncClient, args) -> dict:
+    recorder = Recorder()
+    run_id = uuid.uuid4().hex[:8]
+    semaphore = asyncio.Semaphore(args.concurrency or args.users)
+
+    async def one_user(index: int):
+        async with semaphore:
+            try:
+                await simulate_user(client, recorder, args.turns, args.stream, run_id, index)
+            except (httpx.HTTPError, KeyError, ValueError) as e:
+                print(f"user {index} aborted: {e}")
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one_user(i) for i in range(args.users)))
+    elapsed = time.perf_counter() - start
+
+    requests = sum(len(samples) for samples in recorder.latencies.values())
+    turns = len(recorder.latencies["POST /chat/"])
+    return {
+        "elapsed_seconds": round(elapsed, 3),
+        "throughput": {
+            "requests_per_second": round(requests / elapsed, 2),
+            "chat_turns_per_second": round(turns / elapsed, 2),
+        },
+        "endpoints": {
+            label: dict(summarize(samples), errors=recorder.errors[label])
+            for label, samples in sorted(recorder.latencies.items())
+        },
+        "stages": {stage: summarize(samples) for stage, samples in sorted(recorder.stages.items())},
+    }
+
+
+async def run_in_process(args) -> dict:
+    # Configuration is read at import time, so the app is imported only now
+    from app.main import app
+    from app.services.memory_worker import memory_worker
+
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://load-test", timeout=args.timeout) as client:
+            report = await drive(client, args)
+            report["memory_worker"] = memory_worker.stats()
+        drain_start = time.perf_counter()
+    # Leaving the lifespan drains the memory worker's queue
+    report["memory_drain_seconds"] = round(time.perf_counter() - drain_start, 3)
+    return report
+
+
+async def run_remote(args) -> dict:
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=args.timeout) as client:
+        report = await drive(client, args)
+        response = await client.get("/chat/memory/status")
+        if response.status_code == 200:
+            report["memory_worker"] = response.json()
+    return report
+
+
+def print_report(report: dict, baseline: dict = None):
+    print(f"\nelapsed {report['elapsed_seconds']}s  " + "  ".join(f"{k}={v}" for k, v in report["throughput"].items()))
+    for title, section in (("endpoint", "endpoints"), ("stage", "stages")):
+        if not report[section]:
+            continue
+        print(f"\n{title:<32} {'count':>6} {'p50':>9} {'p95':>9} {'p99':>9}" + ("   p95 vs baseline" if baseline else ""))
+        for name, stats in report[section].items():
+            line = f"{name:<32} {stats['count']:>6} {stats['p50_ms']:>9} {stats['p95_ms']:>9} {stats['p99_ms']:>9}"
+            before = (baseline or {}).get(section, {}).get(name)
+            if before and before["p95_ms"]:
+                line += f"   {(stats['p95_ms'] - before['p95_ms']) / before['p95_ms'] * 100:+.1f}%"
+            print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=10, help="Simulated users")
+    parser.add_argument("--turns", type=int, default=5, help="Chat turns per user")
+    parser.add_argument("--concurrency", type=int, default=0, help="Users active at once (default: all)")
+    parser.add_argument("--stream", action="store_true", help="Request streamed chat answers")
+    parser.add_argument("--base-url", help="Test a running server instead of the in-process app")
+    parser.add_argument("--llm-base-url", help="LLM backend for the in-process app (default: start the stub)")
+    parser.add_argument("--stub-latency-ms", type=float, default=200)
+    parser.add_argument("--stub-jitter-ms", type=float, default=50)
+    parser.add_argument("--stub-templates", help="JSON file of prompt substring -> reply for the stub")
+    parser.add_argument("--fake-embedder", action="store_true", help="Use the deterministic hashing embedder")
+    parser.add_argument("--database-path", help="SQLite file for the in-process app (default: temporary)")
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--output", help="Write the report as JSON to this file")
+    parser.add_argument("--compare", help="Earlier JSON report to compare p95 latencies against")
+    args = parser.parse_args()
+
+    stub = None
+    try:
+        if args.base_url:
+            report = asyncio.run(run_remote(args))
+        else:
+            if args.llm_base_url:
+                os.environ["LLM_BASE_URL"] = args.llm_base_url
+            else:
+                stub, os.environ["LLM_BASE_URL"] = start_stub(args.stub_latency_ms, args.stub_jitter_ms, args.stub_templates)
+            os.environ["DATABASE_PATH"] = args.database_path or os.path.join(tempfile.mkdtemp(), "load_test.sqlite")
+            os.environ["METRICS_TIMING_HEADER"] = "1"
+            if args.fake_embedder:
+                os.environ["EMBEDDING_BACKEND"] = "fake"
+            report = asyncio.run(run_in_process(args))
+    finally:
+        if stub is not None:
+            stub.terminate()
+            stub.wait()
+
+    report["meta"] = {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "args": vars(args),
+    }
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""Tokens and latency per turn for the two memory modes.
+
+    STUB_LLM_LATENCY_MS=300 uvicorn benchmarks.stub_llm:app --port 9000
+    LLM_BASE_URL=http://127.0.0.1:9000/v1 python -m benchmarks.memory_modes --turns 50
+
+Feeds the same user messages through the two-call path (fact extraction, then
+conflict check) and the single-pass path against a throwaway database, and
+reports LLM calls, prompt/completion tokens from the backend's usage blocks,
+and wall time per turn. Point LLM_BASE_URL at a real backend to compare the
+prompts' actual token cost.
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+
+# Importing the models opens the app database; keep it away from real data
+os.environ.setdefault("DATABASE_PATH", os.path.join(tempfile.mkdtemp(), "memory_modes.sqlite"))
+
+from app.models.migrations import run_migrations  # noqa: E402
+from app.services import llm  # noqa: E402
+from app.services.memory_pipeline import MEMORY_MODES, update_user_memory  # noqa: E402
+
+MESSAGES = [
+    "My name is Sam and I live in Berlin.",
+    "I really like coffee in the morning.",
+    "Actually I've stopped drinking coffee, I only drink tea now.",
+    "I work as a data engineer.",
+    "I moved to Munich last month.",
+    "I play tennis every weekend.",
+    "Can you suggest a good book about history?",
+    "I'm allergic to peanuts.",
+]
+
+
+def run_mode(mode: str, turns: int) -> dict:
+    username = f"bench-{mode}-{time.time_ns()}"
+    before = dict(llm.client.usage)
+    latencies = []
+    for turn in range(turns):
+        start = time.perf_counter()
+        update_user_memory(username, MESSAGES[turn % len(MESSAGES)], f"session-{mode}", mode=mode)
+        latencies.append(time.perf_counter() - start)
+    usage = {key: llm.client.usage[key] - before[key] for key in before}
+    latencies.sort()
+    return {
+        "turns": turns,
+        "llm_calls_per_turn": round(usage["calls"] / turns, 2),
+        "prompt_tokens_per_turn": round(usage["prompt_tokens"] / turns, 1),
+        "completion_tokens_per_turn": round(usage["completion_tokens"] / turns, 1),
+        "p50_ms": round(latencies[len(latencies) // 2] * 1000, 1),
+        "p95_ms": round(latencies[int(len(latencies) * 0.95)] * 1000, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--turns", type=int, default=50)
+    parser.add_argument("--modes", nargs="+", default=list(MEMORY_MODES), choices=MEMORY_MODES)
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    run_migrations()
+    report = {mode: run_mode(mode, args.turns) for mode in args.modes}
+    for mode, result in report.items():
+        print(f"{mode:<12} " + "  ".join(f"{key}={value}" for key, value in result.items()))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""Recall and latency of memory retrieval: session-scoped vectors vs user-scoped hybrid.
+
+    python -m benchmarks.retrieval --sessions 40 --turns 25 --fake-embedder
+
+Builds one user's history in a throwaway database and vector store: filler
+turns spread over many sessions, plus "needle" turns that each state a
+detail (a name, a number, an identifier) in one session. Every needle is
+then asked about from a different session, and each method is scored on
+whether the needle is among the top --top-k results:
+
+    session_dense  vector search in the current session only (the old behaviour)
+    user_dense     vector search across all the user's sessions
+    lexical        BM25 keyword search across all the user's sessions
+    hybrid         retrieval.search: both, fused with RRF, under the time budget
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+
+NEEDLES = [
+    ("My locker code at the gym is 4821.", "What was my gym locker code?"),
+    ("My dentist is Dr. Okonkwo on Rua Augusta.", "Who is my dentist again?"),
+    ("The ticket for the VPN outage is INC-20931.", "What's the ticket number for the VPN outage?"),
+    ("My sister Ingrid lives in Tromsø.", "Where does Ingrid live?"),
+    ("Our wifi network is called BlueHeron-5G.", "What's the name of our wifi network?"),
+    ("I booked flight TP1353 for the 14th.", "Which flight did I book?"),
+    ("My bike is a green Brompton M6L.", "What model is my bike?"),
+    ("The landlord's name is Mr. Vasconcelos.", "What is the landlord called?"),
+    ("My passport expires in March 2031.", "When does my passport expire?"),
+    ("The project codename is Kestrel.", "What was the project codename?"),
+    ("My cat Miso needs her pills at 8pm.", "When does Miso get her pills?"),
+    ("The router admin password hint is 'oyster'.", "What was the router password hint?"),
+]
+FILLER = [
+    "Can you suggest a recipe for dinner tonight?",
+    "What's a good stretch for a stiff lower back?",
+    "Help me write a polite reminder email to a colleague.",
+    "Explain the difference between a Roth and a traditional IRA.",
+    "I'm feeling a bit tired today, any tips to stay focused?",
+    "Recommend a podcast about history.",
+    "How long should I boil an egg for a runny yolk?",
+    "What are some good habits for a morning routine?",
+    "Give me ideas for a birthday present for a friend who likes hiking.",
+    "Summarize the main causes of inflation in simple terms.",
+]
+REPLY = "\nSure, here is what I would suggest based on what you told me."
+
+
+def percentile(values: list, q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))] if values else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=40)
+    parser.add_argument("--turns", type=int, default=25, help="Filler turns per session")
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=200)
+    parser.add_argument("--fake-embedder", action="store_true", help="Use the deterministic hashing embedder")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    os.environ["DATABASE_PATH"] = os.path.join(tmp, "retrieval.sqlite")
+    os.environ["VECTOR_STORE_PATH"] = os.path.join(tmp, "chroma")
+    if args.fake_embedder:
+        os.environ["EMBEDDING_BACKEND"] = "fake"
+    # Configuration is read at import time
+    from app.models.migrations import run_migrations
+    from app.services import lexical_index, retrieval, vector_store
+    from app.services.auth import signup
+    from app.utils.embeddings import encode
+
+    run_migrations()
+    username = "bench-user"
+    signup(username, "bench")
+    rng = random.Random(args.seed)
+    sessions = [f"session-{i}" for i in range(args.sessions)]
+
+    texts, session_ids = [], []
+    for session_id in sessions:
+        for _ in range(args.turns):
+            texts.append(rng.choice(FILLER) + REPLY)
+            session_ids.append(session_id)
+    needles = []
+    for statement, question in NEEDLES:
+        home, asked_from = rng.sample(sessions, 2)
+        texts.append(statement + REPLY)
+        session_ids.append(home)
+        needles.append((statement + REPLY, question, asked_from))
+    doc_ids = [f"{username}-{session_id}-{i}" for i, session_id in enumerate(session_ids)]
+
+    start = time.perf_counter()
+    vectors = encode(texts)
+    vector_store.add_message_embeddings(texts, vectors, [username] * len(texts), session_ids, doc_ids)
+    lexical_index.add_interactions(texts, [username] * len(texts), session_ids, doc_ids)
+    print(f"indexed {len(texts)} interactions in {time.perf_counter() - start:.2f}s")
+
+    methods = {
+        "session_dense": lambda q, e, s: [d for (d,) in vector_store.query_similar_messages(e, username, s, args.top_k)],
+        "user_dense": lambda q, e, s: [d for _, d, _, _ in vector_store.query_user_messages(e, username, args.top_k)],
+        "lexical": lambda q, e, s: [d for _, d, _, _ in lexical_index.search(username, q, args.top_k)],
+        "hybrid": lambda q, e, s: retrieval.search(username, q, e, limit=args.top_k, budget_ms=args.budget_ms),
+    }
+    report = {}
+    for name, method in methods.items():
+        hits, latencies = 0, []
+        for needle, question, asked_from in needles:
+            embedding = encode([question])[0]
+            t = time.perf_counter()
+            results = method(question, embedding, asked_from)
+            latencies.append(time.perf_counter() - t)
+            hits += needle in results
+        report[name] = {
+            f"recall@{args.top_k}": round(hits / len(needles), 3),
+            "p50_ms": round(statistics.median(latencies) * 1000, 2),
+            "p95_ms": round(percentile(latencies, 0.95) * 1000, 2),
+        }
+        print(f"{name:<14} " + "  ".join(f"{key}={value}" for key, value in report[name].items()))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
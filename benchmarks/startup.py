@@ -0,0 +1,69 @@
+"""Import time of app.main and time until a worker reports ready.
+
+    python -m benchmarks.startup --runs 5
+
+Each run is a fresh interpreter against a throwaway database. Importing
+app.main should only cost the framework imports (no tables, vector store or
+model); the model load and connection setup show up in the warmup steps that
+run after startup, before /readyz turns 200.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+CHILD = """
+import asyncio, json, time
+start = time.perf_counter()
+import app.main
+imported = time.perf_counter() - start
+
+async def main():
+    from app.services.startup import readiness
+    async with app.main.app.router.lifespan_context(app.main.app):
+        started = time.perf_counter()
+        while readiness.status()["status"] == "starting":
+            await asyncio.sleep(0.005)
+        return time.perf_counter() - started, readiness.status()
+
+ready, status = asyncio.run(main())
+print(json.dumps({"import_seconds": imported, "ready_seconds": ready, "status": status}))
+"""
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    runs = []
+    for _ in range(args.runs):
+        with tempfile.TemporaryDirectory() as tmp:
+            env = dict(os.environ, DATABASE_PATH=os.path.join(tmp, "startup.sqlite"))
+            result = subprocess.run([sys.executable, "-c", CHILD], capture_output=True, text=True, env=env)
+        if result.returncode != 0:
+            print(result.stderr.strip())
+            sys.exit(1)
+        runs.append(json.loads(result.stdout.strip().splitlines()[-1]))
+
+    report = {
+        "runs": len(runs),
+        "import_seconds_median": round(statistics.median(r["import_seconds"] for r in runs), 3),
+        "ready_seconds_median": round(statistics.median(r["ready_seconds"] for r in runs), 3),
+        "last_status": runs[-1]["status"],
+    }
+    print(f"import app.main: {report['import_seconds_median']}s  ready after startup: {report['ready_seconds_median']}s")
+    for step, info in report["last_status"]["steps"].items():
+        print(f"  {step:<14} {info['seconds']}s {'ok' if info['ok'] else info.get('error')}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""Lookup cost of the indexed columns as tables grow.
+
+    python -m benchmarks.storage_lookup --sizes 1000 10000 100000
+
+Fills a throwaway SQLite database (production storage profile) with users,
+sessions and facts, then times the lookups the services run on every request
+and prints SQLite's query plan for each. With the indexes in place every plan
+is an index SEARCH rather than a table SCAN, and per-lookup time stays roughly
+flat while the row count grows by orders of magnitude.
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+
+from sqlalchemy import text
+
+# Importing the models opens the app database; keep it away from real data
+os.environ.setdefault("DATABASE_PATH", os.path.join(tempfile.gettempdir(), "storage_lookup_app.sqlite"))
+
+from app.models.storage import create_storage_engine  # noqa: E402
+
+LOOKUPS = {
+    "user_by_username": 'SELECT id FROM "user" WHERE username = :value',
+    "session_by_session_id": "SELECT id FROM sessiondata WHERE session_id = :value",
+    "sessions_by_user_id": "SELECT session_id FROM sessiondata WHERE user_id = :value",
+    "facts_by_user_name": "SELECT id FROM userfact WHERE user_name = :value",
+}
+
+
+def populate(engine, n: int):
+    from sqlmodel import SQLModel
+    from app.models import database  # noqa: F401  registers the tables
+    SQLModel.metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(
+            text('INSERT INTO "user" (username, password_hash) VALUES (:username, :password_hash)'),
+            [{"username": f"user{i}", "password_hash": "x"} for i in range(n)],
+        )
+        conn.execute(
+            text("INSERT INTO sessiondata (session_id, user_id, data, session_name) VALUES (:session_id, :user_id, '[]', 'New Chat')"),
+            [{"session_id": f"session-{i}", "user_id": i + 1} for i in range(n)],
+        )
+        conn.execute(
+            text(
+                "INSERT INTO userfact (user_name, fact_type, fact_content, source_message, created_at) "
+                "VALUES (:user_name, 'preference', 'likes tea', 'I like tea', CURRENT_TIMESTAMP)"
+            ),
+            [{"user_name": f"user{i}"} for i in range(n)],
+        )
+        conn.execute(text("ANALYZE"))
+
+
+def measure(engine, n: int, repeats: int) -> dict:
+    values = {
+        "user_by_username": lambda: f"user{random.randrange(n)}",
+        "session_by_session_id": lambda: f"session-{random.randrange(n)}",
+        "sessions_by_user_id": lambda: random.randrange(n) + 1,
+        "facts_by_user_name": lambda: f"user{random.randrange(n)}",
+    }
+    results = {}
+    with engine.connect() as conn:
+        for name, sql in LOOKUPS.items():
+            plan = " | ".join(row[-1] for row in conn.execute(text(f"EXPLAIN QUERY PLAN {sql}"), {"value": values[name]()}))
+            start = time.perf_counter()
+            for _ in range(repeats):
+                conn.execute(text(sql), {"value": values[name]()}).all()
+            results[name] = {
+                "us_per_lookup": round((time.perf_counter() - start) / repeats * 1e6, 2),
+                "plan": plan,
+            }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--repeats", type=int, default=2000)
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    report = {}
+    for n in args.sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            engine = create_storage_engine(os.path.join(tmp, "bench.sqlite"), "production")
+            populate(engine, n)
+            report[n] = measure(engine, n, args.repeats)
+            engine.dispose()
+        for name, result in report[n].items():
+            print(f"rows={n:>8}  {name:<24} {result['us_per_lookup']:>8} us  {result['plan']}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
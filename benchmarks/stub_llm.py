@@ -0,0 +1,146 @@
+"""OpenAI-compatible stub of the chat completions API.
+
+Stands in for OpenRouter in tests and benchmarks:
+
+    STUB_LLM_LATENCY_MS=300 uvicorn benchmarks.stub_llm:app --port 9000
+    LLM_BASE_URL=http://127.0.0.1:9000/v1 uvicorn app.main:app
+
+Replies are picked by matching substrings of the prompt against a template
+table; STUB_LLM_TEMPLATES can point at a JSON file of {"substring": "reply"}
+pairs that are checked before the built-in ones.
+
+STUB_LLM_MAX_CONCURRENCY makes it behave like a rate-limited provider: a
+request arriving while that many are already in progress gets a 429 with a
+Retry-After of STUB_LLM_RETRY_AFTER seconds. GET /stats reports how many
+were served and rejected and the peak concurrency seen.
+"""
+import asyncio
+import json
+import os
+import random
+import time
+import uuid
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+LATENCY_MS = float(os.getenv("STUB_LLM_LATENCY_MS", "0"))
+JITTER_MS = float(os.getenv("STUB_LLM_JITTER_MS", "0"))
+# Delay between streamed tokens when the request sets "stream": true
+TOKEN_MS = float(os.getenv("STUB_LLM_TOKEN_MS", "0"))
+# 0 = unlimited
+MAX_CONCURRENCY = int(os.getenv("STUB_LLM_MAX_CONCURRENCY", "0"))
+RETRY_AFTER = os.getenv("STUB_LLM_RETRY_AFTER", "0.1")
+
+# Built-in replies for the prompts the app sends, matched in order
+DEFAULT_TEMPLATES = [
+    ("Return ONLY a JSON object in this shape", '{"new_facts": [], "superseded": []}'),
+    ("Format your response as a JSON array", "[]"),
+    ("You are a conflict analyzer", "no\n[]"),
+    ("Generate a very short", "Stub Chat"),
+    ("Update the running summary", "The user and the assistant have been chatting."),
+]
+DEFAULT_REPLY = "This is a stub answer from the local LLM backend."
+
+
+def load_templates() -> list:
+    templates = []
+    path = os.getenv("STUB_LLM_TEMPLATES")
+    if path:
+        with open(path) as f:
+            templates.extend(json.load(f).items())
+    return templates + DEFAULT_TEMPLATES
+
+
+templates = load_templates()
+stats = {"served": 0, "rejected": 0, "in_flight": 0, "peak_in_flight": 0}
+app = FastAPI()
+
+
+def pick_reply(prompt: str) -> str:
+    for needle, reply in templates:
+        if needle in prompt:
+            return reply
+    return DEFAULT_REPLY
+
+
+def count_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+def finish():
+    stats["in_flight"] -= 1
+    stats["served"] += 1
+
+
+async def stream_reply(reply: str, model: str):
+    completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+    try:
+        for i, token in enumerate(reply.split(" ")):
+            if TOKEN_MS:
+                await asyncio.sleep(TOKEN_MS / 1000)
+            chunk = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "model": model,
+                "choices": [{"index": 0, "delta": {"content": (" " if i else "") + token}}],
+            }
+            yield f"data: {json.dumps(chunk)}\n\n"
+        yield "data: [DONE]\n\n"
+    finally:
+        finish()
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    if MAX_CONCURRENCY and stats["in_flight"] >= MAX_CONCURRENCY:
+        stats["rejected"] += 1
+        return JSONResponse(
+            {"error": {"message": "Rate limit exceeded", "code": 429}},
+            status_code=429,
+            headers={"Retry-After": RETRY_AFTER},
+        )
+    stats["in_flight"] += 1
+    stats["peak_in_flight"] = max(stats["peak_in_flight"], stats["in_flight"])
+    streaming = False
+    try:
+        body = await request.json()
+        prompt = "\n".join(m.get("content", "") for m in body.get("messages", []))
+        delay = (LATENCY_MS + random.uniform(0, JITTER_MS)) / 1000
+        if delay:
+            await asyncio.sleep(delay)
+
+        reply = pick_reply(prompt)
+        if body.get("stream"):
+            streaming = True
+            return StreamingResponse(stream_reply(reply, body.get("model", "stub")), media_type="text/event-stream")
+    finally:
+        # A streamed reply stays in flight until its last chunk is sent
+        if not streaming:
+            finish()
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "stub"),
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": reply},
+            "finish_reason": "stop",
+        }],
+        "usage": {
+            "prompt_tokens": count_tokens(prompt),
+            "completion_tokens": count_tokens(reply),
+            "total_tokens": count_tokens(prompt) + count_tokens(reply),
+        },
+    }
+
+
+@app.get("/health")
+async def health():
+    return {"status": "ok"}
+
+
+@app.get("/stats")
+async def get_stats():
+    return stats